@@ -0,0 +1,374 @@
+#!/usr/bin/env python3
+
+import socket                       # loopback UDP
+import time                         # monotonic clock
+from sys import stdout, stderr, executable  # results, verbose messages, interpreter
+import argparse                     # for the command line arguments
+import os                           # temporary files, paths
+import json                         # machine readable results
+import subprocess                   # end to end sender run, git commit
+import tempfile                     # frames and look-up table files
+import threading                    # local sink
+import statistics                   # timings summary
+import zlib                         # compressed frame archives
+
+import artnetsend                   # code under benchmark
+import artnetrelay
+
+# Benchmarks parameters
+ENCODE_SIZES = [16, 32, 64, 128, 256]          # square frames sides (pixels)
+SHOW_SIZES = [16, 64]                          # square frames sides (pixels)
+DATAGRAM_SIZES = [512, 1472, 8192, 49152]      # relay input datagrams sizes (bytes)
+REASSEMBLY_SIZE = 128                          # relay frames side (pixels)
+BATCH_SIZES = [16, 64, 128]                    # square frames sides (pixels)
+SINK_SIZES = [16, 64, 128]                     # square frames sides (pixels)
+SINK_FRAMES = 2000                             # frames sent by the end to end runs
+SINK_RUNS = [(True, 0), (False, 0), (True, 2), (True, 4)]   # end to end runs batching and shards
+ARCHIVE_SIZES = [64, 128]                      # square frames sides (pixels)
+ARCHIVE_FRAMES = 60                            # frames of the compressed archives
+ARCHIVE_KEYFRAME = 30                          # frames between two keyframes
+SCRIPT_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+
+# Nothing very important here
+VERBOSE=0                   # verbose level
+
+def verbose_1(msg):
+    # Verbose level 1 printing
+    if VERBOSE > 0:
+        stderr.write('\033[38;5;230m\n' + msg)
+
+def git_commit():
+    # Commit of the benchmarked code (to compare results between commits)
+    # output: short commit hash, None outside of a git tree
+
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=SCRIPT_DIRECTORY,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def random_frame(side):
+    # input: frame side in pixels
+    # output: random rgb24 square frame
+
+    return os.urandom(side * side * 3)
+
+def measure(function, min_time, min_runs=3, setup=None):
+    # Run a function until it took at least min_time seconds (and at least
+    # min_runs times)
+    # input: function to run, minimum total time and runs, function run
+    #        before each run and not timed
+    # output: list of the runs durations in seconds
+
+    timings = []
+    total = 0
+
+    while total < min_time or len(timings) < min_runs:
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        function()
+        duration = time.perf_counter() - start
+        timings.append(duration)
+        total += duration
+
+    return timings
+
+def result(name, params, timings, unit_count=1, unit='frame', **extra):
+    # Summary of a benchmark as a dict (one JSON line)
+    # input: benchmark name, parameters, runs durations, units processed
+    #        by run and unit name, extra values
+
+    best = min(timings)
+    median = statistics.median(timings)
+
+    summary = {
+        'benchmark': name,
+        'params': params,
+        'runs': len(timings),
+        'best_s': best,
+        'median_s': median,
+        'mean_s': statistics.fmean(timings),
+        '%ss_per_s' % unit: unit_count / median,
+        }
+    summary.update(extra)
+
+    return summary
+
+def bench_encode(min_time):
+    # ArtDMX encoding of whole frames (packets templates built once)
+
+    for side in ENCODE_SIZES:
+        frame = random_frame(side)
+        packets = artnetsend.artdmx_templates(len(frame))
+
+        timings = measure(lambda: artnetsend.artdmx_encode(packets, frame, 1), min_time)
+
+        yield result('artdmx_encode', {'width': side, 'height': side, 'universes': len(packets)}, timings)
+
+def bench_show(min_time):
+    # frame2ascii: cold (look-up table built, then loaded from the disk
+    # cache) and warm (look-up table in memory)
+
+    lut_cache = artnetsend.XTERM256_LUT_CACHE
+
+    with tempfile.TemporaryDirectory() as directory:
+        artnetsend.XTERM256_LUT_CACHE = os.path.join(directory, 'xterm256-lut.bin')
+
+        for side in SHOW_SIZES:
+            frame = random_frame(side)
+
+            def build():
+                # No look-up table at all
+                artnetsend.XTERM256_LUT = None
+                if os.path.isfile(artnetsend.XTERM256_LUT_CACHE):
+                    os.unlink(artnetsend.XTERM256_LUT_CACHE)
+
+            def load():
+                # Look-up table in the disk cache only
+                artnetsend.XTERM256_LUT = None
+
+            run = lambda: artnetsend.frame2ascii(frame, side, side)
+
+            for cache, setup in (('cold-build', build), ('cold-disk', load), ('warm', None)):
+                timings = measure(run, 0 if setup is build else min_time, setup=setup)
+                yield result('frame2ascii', {'width': side, 'height': side, 'cache': cache}, timings)
+
+    artnetsend.XTERM256_LUT_CACHE = lut_cache
+
+def bench_batch(min_time):
+    # send_batch of a whole frame to a loopback socket (never read, the
+    # kernel drops what doesn't fit): sendmmsg with the messages cached
+    # (the same batch every frame), sendmmsg with the messages built again
+    # every frame, and one send per packet
+
+    udpserver = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    udpserver.bind(('127.0.0.1', 0))
+    udpclient = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    udpclient.connect(udpserver.getsockname())
+
+    for side in BATCH_SIZES:
+        frame = random_frame(side)
+        batch = artnetsend.artdmx_encode(artnetsend.artdmx_templates(len(frame)), frame, 1)
+
+        for mode, batching, setup in (('cached', True, None), ('rebuilt', True, artnetsend.MMSG_CACHE.clear),
+                                      ('unbatched', False, None)):
+            if batching and artnetsend.SENDMMSG is None:
+                continue
+            timings = measure(lambda: artnetsend.send_batch(udpclient, batch, batching), min_time, setup=setup)
+            yield result('send_batch', {'width': side, 'height': side, 'packets': len(batch), 'mode': mode}, timings)
+
+    udpclient.close()
+    udpserver.close()
+
+def bench_reassembly(min_time):
+    # Relay frame reassembly from loopback datagrams: every frame is sent
+    # as datagrams, each datagram is read back at once (send + receive)
+
+    framesize = REASSEMBLY_SIZE * REASSEMBLY_SIZE * 3
+    frame = random_frame(REASSEMBLY_SIZE)
+
+    for size in DATAGRAM_SIZES:
+        udpserver = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        udpserver.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4 * 1024 * 1024)
+        udpserver.bind(('127.0.0.1', 0))
+        udpclient = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        udpclient.connect(udpserver.getsockname())
+
+        reassembler = artnetrelay.FrameReassembler(udpserver, framesize)
+        view = memoryview(frame)
+        chunks = [view[i: i + size] for i in range(0, framesize, size)]
+
+        def run():
+            for chunk in chunks:
+                udpclient.send(chunk)
+                reassembler.read()
+
+        timings = measure(run, min_time)
+        yield result('reassembly', {'width': REASSEMBLY_SIZE, 'height': REASSEMBLY_SIZE, 'datagram': size,
+                                    'datagrams': len(chunks)}, timings,
+                     short=reassembler.short, long=reassembler.long)
+
+        udpclient.close()
+        udpserver.close()
+
+def bench_archive(min_time):
+    # Compressed frame archive decoding, frame after frame as the
+    # decode-ahead thread does (a gradient scrolling one pixel by frame)
+
+    for side in ARCHIVE_SIZES:
+        framesize = side * side * 3
+        gradient = bytes(i // 3 % 256 for i in range(framesize + ARCHIVE_FRAMES * 3))
+
+        archive = bytearray()
+        index = []
+        previous = None
+
+        for count in range(ARCHIVE_FRAMES):
+            frame = gradient[count * 3: count * 3 + framesize]
+            keyframe = count % ARCHIVE_KEYFRAME == 0
+            data = zlib.compress(frame if keyframe else artnetsend.xor_frames(frame, previous), 6)
+            index.append((len(archive), len(data), keyframe))
+            archive += data
+            previous = frame
+
+        decoder = artnetsend.ArchiveDecoder(memoryview(bytes(archive)), index, framesize)
+
+        def run():
+            last = None
+            for frame in range(ARCHIVE_FRAMES):
+                last = (frame, decoder.decode(frame, last))
+
+        timings = measure(run, min_time)
+        yield result('archive_decode', {'width': side, 'height': side, 'frames': ARCHIVE_FRAMES, 'keyframe': ARCHIVE_KEYFRAME},
+                     timings, ARCHIVE_FRAMES, ratio=len(archive) / (framesize * ARCHIVE_FRAMES))
+
+class Sink(threading.Thread):
+    # Local UDP sink counting the received packets
+
+    def __init__(self):
+        threading.Thread.__init__(self, daemon=True)
+
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 16 * 1024 * 1024)
+        self.sock.bind(('127.0.0.1', 0))
+        self.sock.settimeout(1)
+        self.port = self.sock.getsockname()[1]
+        self.packets = 0
+        self.bytes = 0
+        self.first = None       # first packet reception time
+        self.last = None        # last packet reception time
+
+    def run(self):
+        buffer = bytearray(65536)
+
+        while True:
+            try:
+                size = self.sock.recv_into(buffer)
+            except socket.timeout:
+                if self.first is not None:
+                    return
+                continue
+            except OSError:
+                return
+
+            self.last = time.perf_counter()
+            if self.first is None:
+                self.first = self.last
+            self.packets += 1
+            self.bytes += size
+
+def bench_sink(min_time):
+    # End to end artnetsend.py throughput to a local sink: frames are sent
+    # as fast as possible, the rate is measured by the sink (first to last
+    # packet, so that the interpreter startup is not counted)
+
+    script = os.path.join(SCRIPT_DIRECTORY, 'artnetsend.py')
+
+    with tempfile.TemporaryDirectory() as directory:
+        for side in SINK_SIZES:
+            filepath = os.path.join(directory, 'frame.data')
+            with open(filepath, 'wb') as file:
+                file.write(random_frame(side))
+
+            universes = len(artnetsend.artdmx_templates(side * side * 3))
+
+            for batching, shards in SINK_RUNS:
+                sink = Sink()
+                sink.start()
+
+                command = [executable, script, filepath,
+                           '-W', str(side), '-H', str(side), '-f', '1000000', '-L', str(SINK_FRAMES),
+                           '-p', str(sink.port)]
+                if not batching:
+                    command.append('-B')
+                if shards > 0:
+                    command.extend(['--shards', str(shards)])
+                verbose_1('* Running %s' % ' '.join(command))
+                subprocess.run(command, stdout=subprocess.DEVNULL, check=True)
+
+                sink.join()
+                sink.sock.close()
+
+                duration = (sink.last - sink.first) if sink.packets > 1 else 0
+                expected = SINK_FRAMES * universes
+                params = {'width': side, 'height': side, 'universes': universes, 'batching': batching}
+                if shards > 0:
+                    params['shards'] = shards
+                yield result('sender_sink', params,
+                             [duration / SINK_FRAMES], unit='frame',
+                             packets=sink.packets, expected=expected, lost=expected - sink.packets,
+                             megabytes_per_s=sink.bytes / duration / 1e6 if duration > 0 else 0)
+
+BENCHMARKS = {
+    'encode': bench_encode,
+    'show': bench_show,
+    'batch': bench_batch,
+    'reassembly': bench_reassembly,
+    'archive': bench_archive,
+    'sink': bench_sink,
+    }
+
+def compare(results, filepath):
+    # Print the median time ratio of each benchmark compared to a previous
+    # run (JSON lines file)
+    # input: results of this run, previous results filepath
+
+    with open(filepath) as file:
+        previous = [json.loads(line) for line in file if line.strip()]
+
+    baseline = {(line['benchmark'], json.dumps(line['params'], sort_keys=True)): line for line in previous}
+
+    for line in results:
+        old = baseline.get((line['benchmark'], json.dumps(line['params'], sort_keys=True)))
+        if old is None:
+            continue
+        ratio = line['median_s'] / old['median_s'] if old['median_s'] > 0 else 0
+        stderr.write('%-14s %-60s %10.6f -> %10.6f s  x%.2f%s\n' % (line['benchmark'], json.dumps(line['params']),
+                     old['median_s'], line['median_s'], ratio, '  slower' if ratio > 1.1 else ''))
+
+def main():
+    global VERBOSE
+
+    parser = argparse.ArgumentParser(
+                    prog='artnetbench.py',
+                    description='Benchmark artnetsend.py and artnetrelay.py (one JSON line per result)',
+                    epilog='Made with ♥ in Python')
+
+    parser.add_argument('-v','--verbose',action='count',default=0,help='Verbose level (on stderr)')
+    parser.add_argument('-t','--time',type=float,default=0.5,help='Minimum time spent on each benchmark in seconds (default 0.5)')
+    parser.add_argument('-o','--output',default=None,help='Append the results to a file (JSON lines) instead of stdout')
+    parser.add_argument('-c','--compare',default=None,help='Compare the results to a previous run (JSON lines file), on stderr')
+    parser.add_argument('benchmark',nargs='*',help='Benchmarks to run: %s (all by default)' % ', '.join(BENCHMARKS))
+
+    args = parser.parse_args()
+
+    VERBOSE = args.verbose
+
+    for name in args.benchmark:
+        if name not in BENCHMARKS:
+            parser.error('unknown benchmark %s (choose from %s)' % (name, ', '.join(BENCHMARKS)))
+
+    commit = git_commit()
+    results = []
+
+    for name in args.benchmark or list(BENCHMARKS):
+        verbose_1('* Benchmark %s' % name)
+        for line in BENCHMARKS[name](args.time):
+            line['commit'] = commit
+            results.append(line)
+            verbose_1('* %s %s: %f s' % (line['benchmark'], json.dumps(line['params']), line['median_s']))
+
+    lines = ''.join(json.dumps(line) + '\n' for line in results)
+
+    if args.output is None:
+        stdout.write(lines)
+    else:
+        with open(args.output, 'a') as file:
+            file.write(lines)
+
+    if args.compare is not None:
+        compare(results, args.compare)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,244 @@
+#!/usr/bin/env python3
+
+from struct import pack, unpack, iter_unpack, calcsize   # Usefull to play with bytes
+from sys import stderr              # for the verbose messages
+import argparse                     # for the command line arguments
+import os                           # directories listing
+import re                           # natural sort of the frame files
+import zlib                         # compressed frame archives
+
+# Frame archive stuffs
+ARCHIVE_MAGIC = b'ArtNetA\x01'     # Frame archive magic (version 1)
+ARCHIVE_HEADER = '<8sHHI'           # Magic, width, height, frame count (then the frames)
+ARCHIVE_MAGIC_COMPRESSED = b'ArtNetA\x02'     # Compressed frame archive magic (version 2)
+ARCHIVE_HEADER_COMPRESSED = '<8sHHIQ'          # Magic, width, height, frame count, index offset
+ARCHIVE_INDEX_ENTRY = '<QIB'        # Compressed frame offset, size, keyframe (1) or delta (0)
+
+# Nothing very important here
+VERBOSE=0                   # verbose level
+
+def verbose_1(msg):
+    # Verbose level 1 printing
+    if VERBOSE > 0:
+        stderr.write('\033[38;5;230m\n' + msg)
+
+def natural_key(filepath):
+    # Sort key so that anim_10.data comes after anim_9.data
+    # input: filepath
+    # output: list of text and int parts
+
+    return [int(part) if part.isdigit() else part for part in re.split(r'(\d+)', filepath)]
+
+def frame_files(filepaths):
+    # List the raw image files to pack, directories are replaced by
+    # their .data files (in natural order)
+    # input: list of files or directories
+    # output: list of files
+
+    files = []
+
+    for filepath in filepaths:
+        if os.path.isdir(filepath):
+            names = [name for name in os.listdir(filepath) if name.endswith('.data')]
+            files.extend(os.path.join(filepath, name) for name in sorted(names, key=natural_key))
+        else:
+            files.append(filepath)
+
+    return files
+
+def xor_frames(frame, other):
+    # Delta between two frames of the same size (unchanged bytes are 0),
+    # applying it to one frame gives the other one
+    # input: frames
+    # output: frame XOR other (bytes)
+
+    return (int.from_bytes(frame, 'little') ^ int.from_bytes(other, 'little')).to_bytes(len(frame), 'little')
+
+def read_archive(filepath):
+    # Read a frame archive, raw (version 1) or compressed (version 2)
+    # input: filepath
+    # output: (width, height, frames generator) or None if the file is
+    #         not a frame archive
+
+    with open(filepath,'rb') as file:
+        header = file.read(calcsize(ARCHIVE_HEADER_COMPRESSED))
+
+    if header.startswith(ARCHIVE_MAGIC) and len(header) >= calcsize(ARCHIVE_HEADER):
+        _, width, height, count = unpack(ARCHIVE_HEADER, header[:calcsize(ARCHIVE_HEADER)])
+        return width, height, raw_archive_frames(filepath, width * height * 3, count)
+
+    if header.startswith(ARCHIVE_MAGIC_COMPRESSED) and len(header) == calcsize(ARCHIVE_HEADER_COMPRESSED):
+        _, width, height, count, offset = unpack(ARCHIVE_HEADER_COMPRESSED, header)
+        return width, height, compressed_archive_frames(filepath, width * height * 3, count, offset)
+
+    return None
+
+def raw_archive_frames(filepath, framesize, count):
+    # Frames of a raw frame archive, one by one
+    # input: filepath, frame size in bytes, frame count
+
+    with open(filepath,'rb') as file:
+        file.seek(calcsize(ARCHIVE_HEADER))
+        for _ in range(count):
+            frame = file.read(framesize)
+            if len(frame) != framesize:
+                raise ValueError('%s: truncated frame archive (%d frames expected)' % (filepath, count))
+            yield frame
+
+def compressed_archive_frames(filepath, framesize, count, offset):
+    # Frames of a compressed frame archive, one by one
+    # input: filepath, frame size in bytes, frame count, index offset
+
+    with open(filepath,'rb') as file:
+        file.seek(offset)
+        entries = file.read(count * calcsize(ARCHIVE_INDEX_ENTRY))
+        if len(entries) != count * calcsize(ARCHIVE_INDEX_ENTRY):
+            raise ValueError('%s: truncated frame archive (%d frames expected)' % (filepath, count))
+
+        frame = None
+        for offset, size, keyframe in iter_unpack(ARCHIVE_INDEX_ENTRY, entries):
+            file.seek(offset)
+            try:
+                data = zlib.decompress(file.read(size))
+            except zlib.error as error:
+                raise ValueError('%s: corrupted frame archive (%s)' % (filepath, error))
+            if len(data) != framesize:
+                raise ValueError('%s: corrupted frame archive' % filepath)
+            if not keyframe and frame is None:
+                raise ValueError('%s: corrupted frame archive (first frame is not a keyframe)' % filepath)
+            frame = data if keyframe else xor_frames(data, frame)
+            yield frame
+
+def input_frames(filepaths, width, height):
+    # Frames of the raw images and frame archives to pack or export
+    # input: files (from frame_files), frames width and height
+    # output: generator of (filepath, frame)
+
+    framesize = width * height * 3
+
+    for filepath in filepaths:
+        archive = read_archive(filepath)
+
+        if archive is not None:
+            if archive[:2] != (width, height):
+                raise ValueError('%s has %dx%d frames, expected %dx%d' % (filepath, archive[0], archive[1], width, height))
+            for frame in archive[2]:
+                yield filepath, frame
+            continue
+
+        with open(filepath,'rb') as file:
+            frame = file.read()
+
+        if len(frame) != framesize:
+            raise ValueError('%s is %d bytes, %dx%d frames are %d bytes' % (filepath, len(frame), width, height, framesize))
+
+        yield filepath, frame
+
+def main():
+    global VERBOSE
+
+    parser = argparse.ArgumentParser(
+                    prog='artnetpack.py',
+                    description='Pack raw images (rgb24) into a frame archive for artnetsend.py, or export the frames of archives as raw images',
+                    epilog='Made with \u2665 in Python')
+
+    parser.add_argument('-v','--verbose',action='count',default=0,help='Verbose level (on stderr)')
+    parser.add_argument('-W','--width',type=int,default=None,help='Frame width in pixels (default 16, or the first archive one)')
+    parser.add_argument('-H','--height',type=int,default=None,help='Frame height in pixels (default 16, or the first archive one)')
+    parser.add_argument('-o','--output',default=None,help='Frame archive filepath')
+    parser.add_argument('-z','--compress',type=int,default=0,help='Compress the frames with this zlib level, 1 (fastest) to 9 (smallest) (default 0, raw frames)')
+    parser.add_argument('-k','--keyframe',type=int,default=30,help='With --compress, frames between two keyframes, the others are stored as deltas (default 30)')
+    parser.add_argument('-x','--export',default=None,help='Write the frames as raw images (frame_00000.data, ...) in this directory instead of packing them')
+    parser.add_argument('filepath',nargs='+',help='Raw image (rgb24) filepath, directory of .data raw images or frame archive')
+
+    args = parser.parse_args()
+
+    VERBOSE = args.verbose
+
+    if (args.output is None) == (args.export is None):
+        parser.error('either --output or --export is required')
+    if not 0 <= args.compress <= 9:
+        parser.error('compress level must be from 0 to 9')
+    if args.keyframe < 1:
+        parser.error('keyframe must be 1 or more')
+
+    files = frame_files(args.filepath)
+
+    # Frame size of the archives unless given
+    archive = read_archive(files[0]) if files and os.path.isfile(files[0]) else None
+    width, height = archive[:2] if archive is not None else (16, 16)
+    if args.width is None:
+        args.width = width
+    if args.height is None:
+        args.height = height
+
+    frames = input_frames(files, args.width, args.height)
+    count = 0
+
+    try:
+        # Export the frames as raw images
+        if args.export is not None:
+            os.makedirs(args.export, exist_ok=True)
+
+            for filepath, frame in frames:
+                with open(os.path.join(args.export, 'frame_%05d.data' % count),'wb') as file:
+                    file.write(frame)
+                count += 1
+
+            verbose_1('* %d frames exported in %s\n' % (count, args.export))
+            return
+
+        # Written aside, the output (which may be one of the inputs) is only
+        # replaced once every input frame was packed
+        temporary = args.output + '.tmp'
+        try:
+            with open(temporary,'wb') as archive:
+
+                # Header first (the frame count and the index offset are known at the end)
+                if args.compress == 0:
+                    archive.write(pack(ARCHIVE_HEADER, ARCHIVE_MAGIC, args.width, args.height, 0))
+                else:
+                    archive.write(pack(ARCHIVE_HEADER_COMPRESSED, ARCHIVE_MAGIC_COMPRESSED, args.width, args.height, 0, 0))
+
+                index = []
+                previous = None
+
+                for filepath, frame in frames:
+                    verbose_1('* Frame %d: %s' % (count, filepath))
+
+                    if args.compress == 0:
+                        archive.write(frame)
+                    else:
+                        # A keyframe every --keyframe frames (for seeking), else the changes only
+                        keyframe = count % args.keyframe == 0
+                        data = zlib.compress(frame if keyframe else xor_frames(frame, previous), args.compress)
+                        index.append(pack(ARCHIVE_INDEX_ENTRY, archive.tell(), len(data), keyframe))
+                        archive.write(data)
+                        previous = frame
+
+                    count += 1
+
+                if args.compress == 0:
+                    archive.seek(0)
+                    archive.write(pack(ARCHIVE_HEADER, ARCHIVE_MAGIC, args.width, args.height, count))
+                else:
+                    # Index after the frames
+                    offset = archive.tell()
+                    archive.write(b''.join(index))
+                    archive.seek(0)
+                    archive.write(pack(ARCHIVE_HEADER_COMPRESSED, ARCHIVE_MAGIC_COMPRESSED, args.width, args.height, count, offset))
+
+        except BaseException:
+            if os.path.exists(temporary):
+                os.unlink(temporary)
+            raise
+
+        os.replace(temporary, args.output)
+
+    except ValueError as error:
+        parser.error(str(error))
+
+    verbose_1('* %d frames packed in %s\n' % (count, args.output))
+
+if __name__ == '__main__':
+    main()
@@ -1,16 +1,28 @@
 #!/usr/bin/env python3
 
-from struct import pack, unpack     # Usefull to play with bytes
+from struct import pack, pack_into, unpack_from, calcsize   # Usefull to play with bytes
 import socket                       # UDP
+import time                         # monotonic clock (delta keepalive, latency)
 from sys import stdout, stderr      # for the spining indicator
 import argparse                     # for the command line arguments
-
-# For rgb to xterm256 color matching:
-from colormath.color_conversions import convert_color
-from colormath.color_objects import (
-    LabColor,
-    sRGBColor,
-)
+import ctypes, ctypes.util          # sendmmsg (batched UDP sending)
+import os                           # error messages, paths
+import zlib                         # xterm256 look-up table file name (palette checksum)
+import json                         # statistics
+import bisect                       # statistics histograms
+import unicodedata                  # showing frames (chars width)
+import threading, queue             # receive and transmit stages
+import select                       # wait for the sources
+import re                           # sources parsing
+import operator                     # pixel mapping without numpy
+import io                           # stream sources (stdin, named pipes)
+import stat                         # stream sources (stale Unix sockets)
+import multiprocessing              # sharded output (worker processes)
+from multiprocessing import shared_memory   # sharded output (frames)
+import atexit                       # sharded output (workers stopped on exit)
+
+# For rgb to xterm256 color matching colormath and numpy are
+# imported on first use only (when frames are shown)
 import math
 
 # Some Artnet stuffs
@@ -18,6 +30,38 @@ ARTNET_PHYSICAL = 0         # 0 as default value is fine
 ARTNET_DESCRIPTOR_HEADER = b'Art-Net\x00'          # Art-Net
 ARTNET_DESCRIPTOR_HEADER += pack('<H', 0x5000)     # OpCode: ArtDMX (0x5000)
 ARTNET_DESCRIPTOR_HEADER += pack('>H', 14)         # ProtVer: 14
+ARTDMX_SEQUENCE_OFFSET = 12 # Sequence byte position in ArtDMX packet
+ARTDMX_HEADER_SIZE = 18     # ArtDMX header size (DMX data starts here)
+DMX_UNIVERSE_SIZE = 510     # 170 RGB values per universe (510 bytes, maximum in DMX512)
+ARTSYNC_PACKET = b'Art-Net\x00'                    # Art-Net
+ARTSYNC_PACKET += pack('<H', 0x5200)               # OpCode: ArtSync (0x5200)
+ARTSYNC_PACKET += pack('>H', 14)                   # ProtVer: 14
+ARTSYNC_PACKET += pack('>BB', 0, 0)                # Aux1, Aux2
+
+# Batched sending stuffs (sendmmsg is Linux only, sendto is used otherwise)
+try:
+    LIBC = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+    SENDMMSG = LIBC.sendmmsg
+    SENDMMSG.argtypes = [ctypes.c_int, ctypes.c_void_p, ctypes.c_uint, ctypes.c_int]
+    SENDMMSG.restype = ctypes.c_int
+except (OSError, AttributeError):
+    SENDMMSG = None
+SENDMMSG_MAX = 1024         # Maximum messages per sendmmsg call (UIO_MAXIOV)
+SENDMMSG_MIN = 6            # Smaller batches are sent one by one (the ctypes call costs more than the syscalls saved)
+MMSG_CACHE = dict()         # Already built sendmmsg messages by batch (packets ids)
+MMSG_CACHE_MAX = 16         # Batches kept in MMSG_CACHE (delta mode sends changing batches)
+RESOLVE_RETRY = 1           # Seconds before resolving again a destination that failed
+
+# Sharded output stuffs
+SHARD_HEADER = '<IB'        # Shared memory header: frame size, sequence (then the frame)
+SHARD_TIMEOUT = 10          # Seconds to wait for the shards to send a frame
+
+# Raw frames receiving stuffs
+MAX_DATAGRAM_SIZE = 65536   # Room kept after a frame for the next UDP datagram
+MAX_PIPE_SIZE = 1048576     # Pipe buffer asked for the stream sources (default Linux maximum)
+
+# Statistics stuffs
+STATS_BUCKETS = [0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000]  # Histograms buckets upper bounds (ms)
 
 # Nothing very important here
 VERBOSE=0                   # verbose level
@@ -29,6 +73,10 @@ DOT = '\u2b24 '             # BLACK LARGE CIRCLE, SPACE
 PRINTCHAR = DOT             # By default use dot
 ERASE_LINE = '\x1b[2K'      # Erase content of a line
 CURSOR_UP_ONE = '\x1b[1A'   # Go to upper line
+CURSOR_UP = '\x1b[%dF'      # Go to the beginning of an upper line
+CURSOR_DOWN = '\x1b[%dE'    # Go to the beginning of a lower line
+CURSOR_COLUMN = '\x1b[%dG'  # Go to a column of the current line
+COLOR = '\033[38;5;%dm'     # Set xterm256 foreground color
 
 XTERM256RGB = [ # xterm256 color look-up table (xterm256 index to RGB24)
                 # Primary 3-bit (8 colors).
@@ -305,16 +353,289 @@ def rgb2lab(rgb):
     g = rgb & 0xff
     rgb = rgb >> 8
     r = rgb & 0xff
+
+    from colormath.color_conversions import convert_color
+    from colormath.color_objects import LabColor, sRGBColor
+
     lab = convert_color(sRGBColor(r, g, b),LabColor)
     return (lab.lab_l,lab.lab_a,lab.lab_b)
 
-# Build xterm256 colors lab look-up table
-XTERM256LAB = list( map(lambda rgb: rgb2lab(rgb),
-                    XTERM256RGB))
+XTERM256LAB = [ # xterm256 color lab look-up table (xterm256 index to lab, same order as XTERM256RGB)
+                # Precomputed with rgb2lab: list(map(rgb2lab, XTERM256RGB))
+                (0.0, 0.0, 0.0), # 0x000000
+                (3202.5910610465476, 3723.0255331516755, 3123.873793861577), # 0x800000
+                (4806.148578881304, -4006.2368133402765, 3866.6223811044924), # 0x008000
+                (5243.287283381249, -1002.1178865245304, 4391.802702617724), # 0x808000
+                (2229.2090155751953, 3681.2326486312, -5014.154149146934), # 0x000080
+                (3531.9246905029536, 4566.49440264321, -2827.9315746885964), # 0x800080
+                (4963.220447610605, -2235.160052736692, -657.2380823974484), # 0x008080
+                (7441.554882282263, -0.029533811911619523, -0.5504099211805169), # 0xc0c0c0
+                (5376.289444627731, -0.02135483610388178, -0.39798159786101905), # 0x808080
+                (5569.417504595725, 6460.793430576633, 5421.048850085641), # 0xff0000
+                (8352.168733274038, -6952.267249978224, 6709.985804801282), # 0x00ff00
+                (9110.762206548767, -1739.0363295306556, 7621.363269416317), # 0xffff00
+                (3880.248233844353, 6388.267687373855, -8701.367717798912), # 0x0000ff
+                (6140.930251611103, 7924.516438217041, -4907.482255272506), # 0xff00ff
+                (8624.745133456714, -3878.809655324538, -1140.5453567984496), # 0x00ffff
+                (9341.568974319263, -0.037058350415009045, -0.6906417562959177), # 0xffffff
+                (0.0, 0.0, 0.0), # 0x000000
+                (1752.9661314738078, 2900.3873725475514, -3950.57600708834), # 0x00005f
+                (2326.86939319662, 3841.3560794938453, -5232.255975863623), # 0x000087
+                (2867.2291551772646, 4727.327044339685, -6439.0243095785), # 0x0000af
+                (3383.219273303927, 5573.3416719498955, -7591.368689890368), # 0x0000d7
+                (3880.248233844353, 6388.267687373855, -8701.367717798912), # 0x0000ff
+                (3783.2977303230023, -3156.453224755527, 3046.4531310552184), # 0x005f00
+                (3907.052273468844, -1761.0487060606558, -517.8279171384958), # 0x005f5f
+                (4059.6775331189383, -445.97916326927844, -2408.5714708386063), # 0x005f87
+                (4271.395886085866, 970.7386571568328, -4127.157913959829), # 0x005faf
+                (4532.74600413399, 2348.880552041962, -5688.216316502022), # 0x005fd7
+                (4832.6594919746285, 3635.5749596526794, -7119.367316736769), # 0x005fff
+                (5015.898694747251, -4180.49702578265, 4034.8097521860113), # 0x008700
+                (5087.74221201277, -3304.4358456550603, 1176.2307511016843), # 0x00875f
+                (5179.802755004109, -2332.383328289353, -685.8261198001358), # 0x008787
+                (5313.4904197109645, -1132.867655776657, -2471.7151265238995), # 0x0087af
+                (5487.4097653199315, 171.81277608309742, -4145.109324524666), # 0x0087d7
+                (5697.946243818868, 1493.7272933970469, -5706.291669489886), # 0x0087ff
+                (6176.456593919972, -5144.687511335306, 4965.398902251125), # 0x00af00
+                (6224.205878448495, -4543.922239390198, 2669.5221386862686), # 0x00af5f
+                (6286.285633656628, -3826.345798045235, 921.9067675494316), # 0x00af87
+                (6378.163512178749, -2870.324582625539, -844.0051629561339), # 0x00afaf
+                (6500.612990716983, -1747.762933511865, -2551.3092354032906), # 0x00afd7
+                (6652.997059145597, -530.3130147027844, -4177.653466922056), # 0x00afff
+                (7284.674580566458, -6065.394043430377, 5854.019482935089), # 0x00d700
+                (7319.130453504008, -5625.3641762313255, 3991.7090673752696), # 0x00d75f
+                (7364.230601728099, -5079.768331300862, 2394.515317473248), # 0x00d787
+                (7431.594190388181, -4320.418781685241, 697.1135364203974), # 0x00d7af
+                (7522.479488606042, -3384.0052652002655, -995.0505014618329), # 0x00d7d7
+                (7637.277685863358, -2317.533824472207, -2640.3844191611056), # 0x00d7ff
+                (8352.168733274038, -6952.267249978224, 6709.985804801282), # 0x00ff00
+                (8378.435942262424, -6614.096089162935, 5179.174525111274), # 0x00ff5f
+                (8412.941906385795, -6185.948688073662, 3741.114349955529), # 0x00ff87
+                (8464.739654320112, -5574.309000020385, 2138.8698088181472), # 0x00ffaf
+                (8535.103395810449, -4795.924041361723, 492.69732426831183), # 0x00ffd7
+                (8624.745133456714, -3878.809655324538, -1140.5453567984496), # 0x00ffff
+                (2519.8790823299205, 2933.3153524106538, 2461.2527840415873), # 0x5f0000
+                (2779.3560541496136, 3597.8716822367096, -2228.084397954343), # 0x5f005f
+                (3062.2216418317707, 4247.20553785308, -3991.387637670445), # 0x5f0087
+                (3411.792600807655, 4983.250651400761, -5517.960797835736), # 0x5f00af
+                (3800.373585995155, 5748.010944163728, -6884.9791639748655), # 0x5f00d7
+                (4209.681746860205, 6515.498321195622, -8143.1566440410525), # 0x5f00ff
+                (4127.712685746933, -789.5534842006065, 3460.2347412432687), # 0x5f5f00
+                (4232.503071419587, -0.016825151487154244, -0.3135636649787443), # 0x5f5f5f
+                (4363.677524425327, 855.1045940217392, -1910.4885235300344), # 0x5f5f87
+                (4548.780352515721, 1885.5797337119106, -3666.412240095504), # 0x5f5faf
+                (4781.596419733316, 2982.803507964469, -5271.8570107521955), # 0x5f5fd7
+                (5053.651736877923, 4077.7908831122895, -6748.048253397002), # 0x5f5fff
+                (5222.024176654448, -2550.9766433020823, 4284.617610061729), # 0x5f8700
+                (5288.430292517457, -1911.5804670556927, 1482.4272548662493), # 0x5f875f
+                (5373.821108891477, -1168.171348417893, -376.2566063154111), # 0x5f8787
+                (5498.380495309543, -206.95170350139946, -2170.0219169803745), # 0x5f87af
+                (5661.329278580863, 886.4538851797512, -3857.7506790015077), # 0x5f87d7
+                (5859.809241091151, 2037.7202349512836, -5436.8216463955105), # 0x5f87ff
+                (6315.085021172267, -3977.514272053828, 5133.973222225237), # 0x5faf00
+                (6360.78854096097, -3480.1945706221923, 2869.618600870376), # 0x5faf5f
+                (6420.274182448087, -2875.456393038615, 1129.4536895431947), # 0x5faf87
+                (6508.443663125622, -2053.279498654959, -635.8749083390251), # 0x5fafaf
+                (6626.180998256972, -1066.471659623808, -2347.0394849871636), # 0x5fafd7
+                (6773.043469592449, 26.546864934648084, -3980.1370916783712), # 0x5fafff
+                (7385.26767274897, -5191.04370581568, 5976.536144940542), # 0x5fd700
+                (7418.79963443533, -4801.5769383724455, 4132.611373739802), # 0x5fd75f
+                (7462.709311263468, -4314.921422733896, 2542.5535597389), # 0x5fd787
+                (7528.333586114973, -3631.1694281742175, 848.1522564560848), # 0x5fd7af
+                (7616.943442141351, -2778.571033627628, -844.0522479069642), # 0x5fd7d7
+                (7728.979116260829, -1796.227664227228, -2491.548941526287), # 0x5fd7ff
+                (8429.084929810379, -6271.723755858947, 6803.744969618292), # 0x5fff00
+                (8454.878027509409, -5960.699705225704, 5284.1196449893605), # 0x5fff5f
+                (8488.76774808538, -5565.454063281745, 3851.9115892900004), # 0x5fff87
+                (8539.654211614241, -4998.121245127173, 2253.123263323525), # 0x5fffaf
+                (8608.80589580047, -4271.848828846451, 608.325638287667), # 0x5fffd7
+                (8696.945293991039, -3410.512029843325, -1025.1001196003272), # 0x5fffff
+                (3342.5908634035773, 3884.9668388116534, 3259.753657265759), # 0x870000
+                (3498.7910618483497, 4298.844930562753, -1049.1094202955246), # 0x87005f
+                (3686.249594172614, 4765.124269472785, -2950.9387707027654), # 0x870087
+                (3938.7752766210924, 5353.461685286166, -4632.8891653620385), # 0x8700af
+                (4241.307490276626, 6014.259399943203, -6141.70326918297), # 0x8700d7
+                (4579.22696139708, 6711.887801136626, -7518.92856479914), # 0x8700ff
+                (4510.216248408053, 899.510667818479, 3905.6334870069945), # 0x875f00
+                (4598.548381809893, 1412.1892231563322, 573.8837048116295), # 0x875f5f
+                (4710.469485991246, 2007.5995507066225, -1346.8281255338127), # 0x875f87
+                (4870.723010339318, 2776.6993520853125, -3134.41779208534), # 0x875faf
+                (5075.693053348899, 3651.52130340935, -4781.552860938465), # 0x875fd7
+                (5319.338845350172, 4574.48511687776, -6302.786082870435), # 0x875fff
+                (5472.051722928533, -1045.7072408074737, 4582.8339640286185), # 0x878700
+                (5532.643657046019, -570.8016511820056, 1851.4262888588362), # 0x87875f
+                (5610.839110050064, -0.022283712365123165, -0.41529269578859385), # 0x878787
+                (5725.437656142325, 765.3870000667631, -1801.0713720177478), # 0x8787af
+                (5876.242781826444, 1670.0232806448341, -3503.7183835801757), # 0x8787d7
+                (6061.1610279286515, 2657.086372372479, -5102.353319191296), # 0x8787ff
+                (6489.6715990884595, -2741.7068087018065, 5344.337976029558), # 0x87af00
+                (6532.979304298238, -2335.190716200749, 3120.138899907809), # 0x87af5f
+                (6589.4179524190195, -1833.0661552530678, 1390.1972206815117), # 0x87af87
+                (6673.2142231141115, -1137.6185519591963, -373.53805156738105), # 0x87afaf
+                (6785.365305721574, -285.16027502260147, -2088.7290146979694), # 0x87afd7
+                (6925.64047907047, 679.3001550189643, -3729.5389698611275), # 0x87afff
+                (7514.308203588621, -4192.236705063088, 6132.796087901835), # 0x87d700
+                (7546.708168304381, -3853.5721597012903, 4312.537988872165), # 0x87d75f
+                (7589.157522856899, -3427.11900203172, 2731.924505077147), # 0x87d787
+                (7652.644736336584, -2822.1537806017486, 1041.699616134767), # 0x87d7af
+                (7738.452584069952, -2059.0039517041596, -650.2300244579999), # 0x87d7d7
+                (7847.07705489258, -1168.7059087854834, -2300.181754063672), # 0x87d7ff
+                (8528.75498259812, -5458.601954481345, 6924.768001995686), # 0x87ff00
+                (8553.952515129258, -5177.183954426564, 5419.643916540938), # 0x87ff5f
+                (8587.067706782467, -4818.119567677748, 3995.126265795355), # 0x87ff87
+                (8636.807947933597, -4300.02995447564, 2400.9559396680343), # 0x87ffaf
+                (8704.433493855886, -3632.443267219685, 758.0850655923882), # 0x87ffd7
+                (8790.678729774227, -2834.8435793363437, -875.4338932227739), # 0x87ffff
+                (4117.2167835718965, 4780.996195983245, 4011.583748806774), # 0xaf0000
+                (4222.520383119286, 5063.992935075845, 107.5139776703054), # 0xaf005f
+                (4354.285788233766, 5404.7707015295855, -1852.4231931226864), # 0xaf0087
+                (4540.137017564362, 5864.153273623682, -3631.543748678412), # 0xaf00af
+                (4773.773670024487, 6412.905599322983, -5249.290417784361), # 0xaf00d7
+                (5046.647797044091, 7021.9443961062425, -6732.5817253678), # 0xaf00ff
+                (4990.010287166767, 2436.42049314591, 4447.141653861739), # 0xaf5f00
+                (5062.582944058468, 2779.505081551786, 1289.2660736449016), # 0xaf5f5f
+                (5155.533432654183, 3196.4705421243416, -630.9623778536079), # 0xaf5f87
+                (5290.431345954897, 3763.1348160717052, -2445.6088988595097), # 0xaf5faf
+                (5465.793730374273, 4443.4713857685465, -4134.302898522321), # 0xaf5fd7
+                (5677.902221717623, 5198.472992854117, -5703.97396638614), # 0xaf5fff
+                (5812.647683906288, 541.5191881090635, 4981.3953340811995), # 0xaf8700
+                (5866.462038247182, 886.5469264484744, 2349.3403232123596), # 0xaf875f
+                (5936.189713014751, 1312.4998006894336, 511.19423452145867), # 0xaf8787
+                (6038.919311265303, 1902.0540021915658, -1294.5853395263796), # 0xaf87af
+                (6175.023763934623, 2624.183430952854, -3013.5387465784434), # 0xaf87d7
+                (6343.224811879789, 3440.7861917174714, -4635.2422319341795), # 0xaf87ff
+                (6737.816827611964, -1286.889321799702, 5639.8195037221185), # 0xafaf00
+                (6778.028814804641, -966.988687667552, 3473.317359158419), # 0xafaf5f
+                (6830.516277525364, -565.8924307045154, 1759.4077126986376), # 0xafaf87
+                (6908.614159329076, -0.027423231255596647, -0.5110758678682714), # 0xafafaf
+                (7013.439371276552, 708.9392780039886, -1719.9114399447424), # 0xafafd7
+                (7145.008710013834, 1529.824181617208, -3370.2373388536757), # 0xafafff
+                (7701.957668186974, -2926.1779703117413, 6358.274812753082), # 0xafd700
+                (7732.810679093183, -2642.707198149829, 4572.535272931257), # 0xafd75f
+                (7773.261368795086, -2282.7713044276015, 3006.2048352724887), # 0xafd787
+                (7833.817564075397, -1766.7125321482615, 1322.6836001756226), # 0xafd7af
+                (7915.7714079146335, -1107.112260154814, -368.21540232413383), # 0xafd7d7
+                (8019.687217206455, -326.3560447920284, -2021.1198691910681), # 0xafd7ff
+                (8675.616484317847, -4376.123606626323, 7102.142227281199), # 0xafff00
+                (8699.973255811059, -4129.841927838108, 5618.381061078788), # 0xafff5f
+                (8731.994253383684, -3814.1180226290458, 4205.403712318747), # 0xafff87
+                (8780.113567684522, -3355.7292329386783, 2618.315471970905), # 0xafffaf
+                (8845.577916029788, -2760.3769442295416, 978.574359807655), # 0xafffd7
+                (8929.136025028969, -2042.5840483158454, -654.7931860298547), # 0xafffff
+                (4856.907908215524, 5636.61559324785, 4729.507112166544), # 0xd70000
+                (4933.4077844761305, 5843.620468615373, 1211.1793002092966), # 0xd7005f
+                (5031.133268761799, 6101.560760245736, -757.8830982781227), # 0xd70087
+                (5172.493295475085, 6463.120017524641, -2589.821264463333), # 0xd700af
+                (5355.515036919108, 6913.617252210532, -4281.454174458465), # 0xd700d7
+                (5575.913262137312, 7433.908774391707, -5846.9184211167685), # 0xd700ff
+                (5529.624986724334, 3780.6536764567722, 5038.274799680356), # 0xd75f00
+                (5588.98526331948, 4022.8945319684717, 2083.216333223193), # 0xd75f5f
+                (5665.648234932176, 4325.627066338491, 178.4887009726873), # 0xd75f87
+                (5778.110384977004, 4751.1291810379535, -1652.4379612451553), # 0xd75faf
+                (5926.287775858866, 5282.224510521864, -3375.111891688664), # 0xd75fd7
+                (6108.241804150224, 5895.431745932129, -4988.666590452087), # 0xd75fff
+                (6225.244476132195, 2052.6897432447663, 5453.761030984121), # 0xd78700
+                (6272.258515227992, 2306.4082262319303, 2944.468582288698), # 0xd7875f
+                (6333.406772910547, 2625.7475438386814, 1128.8618693037492), # 0xd78787
+                (6423.954618010927, 3078.4907433354365, -677.2669243042869), # 0xd787af
+                (6544.71671314913, 3649.2341798503103, -2410.386868521145), # 0xd787d7
+                (6695.127238518477, 4314.745469711454, -4054.904812907134), # 0xd787ff
+                (7052.494128922639, 224.01085713778812, 6009.007605353571), # 0xd7af00
+                (7089.233199954052, 472.8317235945134, 3916.213416739451), # 0xd7af5f
+                (7137.269734837299, 788.6896132137338, 2224.9387423062417), # 0xd7af87
+                (7208.912368208794, 1241.3895506789318, 472.28726101106275), # 0xd7afaf
+                (7305.376071727682, 1819.7367243028245, -1250.0769931677653), # 0xd7afd7
+                (7426.917462688581, 2503.964215732509, -2910.18691453618), # 0xd7afff
+                (7946.4972880005125, -1517.194350444072, 6649.136132861061), # 0xd7d700
+                (7975.4946224331225, -1284.9082274369366, 4908.427262526696), # 0xd7d75f
+                (8013.543255842624, -987.6866163683999, 3361.609975591273), # 0xd7d787
+                (8070.567663997371, -557.2467821461373, 1687.886047126817), # 0xd7d7af
+                (8147.86095025371, -0.032330963378512934, -0.6025393219459829), # 0xd7d7d7
+                (8246.057193359984, 669.1775246289495, -1656.3092032291365), # 0xd7d7ff
+                (8870.221092716056, -3108.188928533622, 7335.488452742842), # 0xd7ff00
+                (8893.526921266968, -2897.6215158812834, 5879.986810523413), # 0xd7ff5f
+                (8924.178907415879, -2626.391343812223, 4482.656002144156), # 0xd7ff87
+                (8970.267529269813, -2230.0974309762937, 2905.4394561846975), # 0xd7ffaf
+                (9033.019420947769, -1711.1425486416395, 1270.3601634121155), # 0xd7ffd7
+                (9113.197194048804, -1079.3985251355095, -362.29488485748504), # 0xd7ffff
+                (5569.417504595725, 6460.793430576633, 5421.048850085641), # 0xff0000
+                (5627.94809628351, 6619.768185666555, 2256.1233286459255), # 0xff005f
+                (5703.577138445479, 6821.703878581282, 309.0994885832515), # 0xff0087
+                (5814.5949872512165, 7111.546090458937, -1545.161668915442), # 0xff00af
+                (5960.991313327073, 7482.921682444321, -3282.9055895716947), # 0xff00d7
+                (6140.930251611103, 7924.516438217041, -4907.482255272506), # 0xff00ff
+                (6102.827715011454, 4966.144054213032, 5650.540327607568), # 0xff5f00
+                (6151.719432688028, 5146.210186179602, 2910.8394850722902), # 0xff5f5f
+                (6215.244709439679, 5375.156574259389, 1036.627670735149), # 0xff5f87
+                (6309.183029405289, 5704.060467571743, -798.0770818103067), # 0xff5faf
+                (6434.240658864919, 6125.69960063604, -2544.193081118888), # 0xff5fd7
+                (6589.667026462119, 6626.88571196967, -4193.08947589667), # 0xff5fff
+                (6690.6196230935875, 3437.4525457025024, 5974.828868231129), # 0xff8700
+                (6731.394457431785, 3629.0068278332833, 3604.406471256179), # 0xff875f
+                (6784.601464046252, 3873.357167427912, 1820.918523354433), # 0xff8787
+                (6863.73934489379, 4225.828260373152, 21.1210452965787), # 0xff87af
+                (6969.9054922380255, 4679.879504656274, -1721.5065517527491), # 0xff87d7
+                (7103.073999830986, 5222.298757100969, -3385.6721086486045), # 0xff87ff
+                (7423.253310657695, 1693.9335387312226, 6436.7973785588365), # 0xffaf00
+                (7456.445989093482, 1888.492511986641, 4430.816016755189), # 0xffaf5f
+                (7499.918175492457, 2137.837241875033, 2769.1252431764083), # 0xffaf87
+                (7564.902620234923, 2499.706272386689, 1028.206180825606), # 0xffafaf
+                (7652.6742785195665, 2969.448229725515, -694.5371484796794), # 0xffafd7
+                (7763.690602119493, 3535.4564457623637, -2363.163688291661), # 0xffafff
+                (8243.08398070989, -65.96690107181047, 6997.653816874114), # 0xffd700
+                (8270.046255218798, 123.0085830559986, 5311.389078500912), # 0xffd75f
+                (8305.455113358676, 366.391978514244, 3789.4588494666664), # 0xffd787
+                (8358.586918315776, 721.9277119548692, 2129.1179785548406), # 0xffd7af
+                (8430.722975703879, 1187.3796527478576, 445.07386213559244), # 0xffd7d7
+                (8522.558273288114, 1753.7991701827593, -1212.5387864680447), # 0xffd7ff
+                (9110.762206548767, -1739.0363295306556, 7621.363269416317), # 0xffff00
+                (9132.860194185874, -1561.363234549539, 6200.638214992343), # 0xffff5f
+                (9161.937064432745, -1331.5018301443545, 4823.148665811594), # 0xffff87
+                (9205.685692502486, -993.6707631412531, 3258.85702273428), # 0xffffaf
+                (9265.305326952071, -547.8300308740315, 1630.3129421639937), # 0xffffd7
+                (9341.568974319263, -0.037058350415009045, -0.6906417562959177), # 0xffffff
+                (573.8049314283932, -0.0023357773675236615, -0.04353095497684478), # 0x080808
+                (1108.9519110753733, -0.00445509535929034, -0.08302784256777329), # 0x121212
+                (1584.531338389714, -0.0063385107118563155, -0.11812830635662408), # 0x1c1c1c
+                (2026.6094868002465, -0.008089252489185128, -0.15075618542255143), # 0x262626
+                (2445.766338006734, -0.009749220106769485, -0.18169234252454203), # 0x303030
+                (2847.7009733806444, -0.01134098337374212, -0.21135740224735855), # 0x3a3a3a
+                (3235.9510089568603, -0.012878552146489142, -0.2400124607561338), # 0x444444
+                (3612.9129128270356, -0.014371417051961544, -0.26783439100981354), # 0x4e4e4e
+                (3980.310101071406, -0.015826403256369304, -0.2949503909064788), # 0x585858
+                (4339.437227060685, -0.01724863790997233, -0.32145601322213224), # 0x626262
+                (4691.299790061205, -0.018642103050581227, -0.34742546951491704), # 0x6c6c6c
+                (5036.699522152087, -0.020009973738410736, -0.3729179321680931), # 0x767676
+                (5376.289444627731, -0.02135483610388178, -0.39798159786101905), # 0x808080
+                (5710.610903783332, -0.02267883401074755, -0.42265642102989887), # 0x8a8a8a
+                (6040.119366114346, -0.02398377123569162, -0.44697601768604045), # 0x949494
+                (6365.20291480149, -0.02527118467554601, -0.47096903057450845), # 0x9e9e9e
+                (6686.195844388486, -0.02654239822419413, -0.4946601325329425), # 0xa8a8a8
+                (7003.388867325477, -0.027798563177583446, -0.5180707797904915), # 0xb2b2b2
+                (7317.0369197362015, -0.0290406891458872, -0.5412197880815484), # 0xbcbcbc
+                (7627.365228770829, -0.030269668087612445, -0.5641237804496768), # 0xc6c6c6
+                (7934.574096920862, -0.031486293252669384, -0.586797540361772), # 0xd0d0d0
+                (8238.84272322196, -0.032691274313378926, -0.6092542937153667), # 0xdadada
+                (8540.332290479735, -0.03388524958580774, -0.6315059367210551), # 0xe4e4e4
+                (8839.188485482277, -0.03506879604486812, -0.65356322189416)] # 0xeeeeee
 
 # Already calculated correspondance look-up hashtable
 FAST_RGB2XTERM256 = dict()  
 
+# Vectorized rgb to xterm256 stuffs (same Lab conversion as colormath)
+SRGB_TO_XYZ = (             # sRGB to XYZ matrix
+                (0.412424, 0.357579, 0.180464),
+                (0.212656, 0.715158, 0.0721856),
+                (0.0193324, 0.119193, 0.950444))
+D65 = (0.95047, 1.0, 1.08883)   # D65 (2 degrees) reference white
+CIE_E = 216 / 24389
+XTERM256_LUT_BITS = 6       # RGB cube resolution (bits per channel)
+XTERM256_LUT_VERSION = 1    # Look-up table algorithm (matching metric), to bump when it changes
+XTERM256_LUT = None         # RGB cube to xterm256 index look-up table (built on first use)
+XTERM256_LUT_CACHE = os.path.join(os.path.expanduser('~'), '.cache', 'artnet',
+                        'xterm256-lut-%d-v%d-%08x.bin' % (XTERM256_LUT_BITS, XTERM256_LUT_VERSION,
+                        zlib.crc32(repr(XTERM256LAB).encode()))) # Built look-up table file (a changed palette or metric rebuilds it)
+
 def distance_euclidean(xyz1,xyz2):
     # Calculate the Euclidean distance between two 
     # xyz coordinates
@@ -357,10 +678,13 @@ def rgb2xterm256_lab(r,g,b):
     rgb += b
     
     # If rgb is in the hashtable return the already calcultate xterm256 index
-    if rgb in FAST_RGB2XTERM256.keys():
+    if rgb in FAST_RGB2XTERM256:
         return FAST_RGB2XTERM256[rgb]
     
     i = 0
+
+    from colormath.color_conversions import convert_color
+    from colormath.color_objects import LabColor, sRGBColor
     
     # Convert rgb color to look to lab representation
     srgb = sRGBColor(r, g, b)
@@ -390,6 +714,1193 @@ def rgb2xterm256_lab(r,g,b):
 
     return best_match
 
+def artdmx_templates(framesize, start=0, channels=DMX_UNIVERSE_SIZE):
+    # Build one preallocated ArtDMX packet per universe of a frame.
+    # Header, physical, universe and length fields are written once here,
+    # only the sequence byte and the DMX data are patched for each frame.
+    # input: frame size in bytes, first universe, channels per universe
+    # output: list of ArtDMX packets (bytearray), one per universe
+
+    packets = []
+
+    # First Artnet payload for a frame is in the start universe
+    universe = start
+    index = 0
+
+    while index < framesize:
+        length = min(channels, framesize - index)
+
+        packet = bytearray(ARTDMX_HEADER_SIZE + length)
+        packet[:ARTDMX_SEQUENCE_OFFSET] = ARTNET_DESCRIPTOR_HEADER  # Header first
+        pack_into('>B', packet, 13, ARTNET_PHYSICAL)                # The artnet physical
+        pack_into('<H', packet, 14, universe)                       # The universe index
+        pack_into('>H', packet, 16, length)                         # The artnet payload length
+        packets.append(packet)
+
+        universe = (universe + 1) % 65536
+        index += channels
+
+    return packets
+
+def artdmx_encode(packets, frame, sequence):
+    # Patch the preallocated ArtDMX packets with a frame
+    # input: packets from artdmx_templates (built for len(frame)),
+    #        frame as raw rgb pixel values, sequence index
+    # output: the same packets, ready to be sent
+
+    view = memoryview(frame)
+    index = 0
+
+    for packet in packets:
+        # Same length slice assignment copies in place (no reallocation)
+        length = len(packet) - ARTDMX_HEADER_SIZE
+        packet[ARTDMX_SEQUENCE_OFFSET] = sequence
+        packet[ARTDMX_HEADER_SIZE:] = view[index: index + length]
+        index += length
+
+    return packets
+
+def parse_destinations(destinations, port, interval=60, ttl=1, loop=True, interface=None):
+    # Destinations and the universes they receive
+    # input: list of HOST or HOST:FIRST-LAST (or HOST:UNIVERSE), port,
+    #        seconds between two resolutions of the hosts, multicast
+    #        options and sending interface (see Destination)
+    # output: list of (Destination, first universe, last universe),
+    #         first and last are None when all universes are sent
+    #         (one Destination by host)
+
+    routes = []
+    nodes = dict()
+
+    for destination in destinations:
+        host, _, universes = destination.partition(':')
+        first = last = None
+
+        if universes:
+            match = re.fullmatch(r'(\d+)(?:-(\d+))?', universes)
+            if match is None:
+                raise ValueError('invalid destination %s (expected HOST or HOST:FIRST-LAST)' % destination)
+            first = int(match.group(1))
+            last = int(match.group(2)) if match.group(2) is not None else first
+
+        if host not in nodes:
+            nodes[host] = Destination(host, port, interval, ttl, loop, interface)
+
+        routes.append((nodes[host], first, last))
+
+    return routes
+
+def universe_routes(routes, start, count):
+    # Destinations of every universe of a frame (precomputed once)
+    # input: routes from parse_destinations, first universe, universes
+    #        by frame
+    # output: list of Destination lists, by universe index in the frame
+
+    destinations = []
+
+    for index in range(count):
+        universe = (start + index) % 65536
+        destinations.append([destination for destination, first, last in routes if first is None or first <= universe <= last])
+
+    return destinations
+
+class WhiteChannel:
+    # RGBW LEDs: a white byte (always 0) is added to every pixel
+
+    def __init__(self):
+        self.out = bytearray()
+
+    def apply(self, frame):
+        # input: frame as raw rgb pixel values
+        # output: frame as raw rgbw pixel values (the output buffer is
+        #         reused by the next call)
+
+        if not isinstance(frame, (bytes, bytearray)):
+            frame = bytes(frame)
+
+        pixels = len(frame) // 3
+        if len(self.out) != pixels * 4:
+            self.out = bytearray(pixels * 4)
+
+        for channel in range(3):
+            self.out[channel::4] = frame[channel:pixels * 3:3]
+
+        return self.out
+
+class IOVec(ctypes.Structure):
+    # struct iovec
+    _fields_ = [('iov_base', ctypes.c_void_p),
+                ('iov_len', ctypes.c_size_t)]
+
+class MsgHdr(ctypes.Structure):
+    # struct msghdr
+    _fields_ = [('msg_name', ctypes.c_void_p),
+                ('msg_namelen', ctypes.c_uint32),
+                ('msg_iov', ctypes.c_void_p),
+                ('msg_iovlen', ctypes.c_size_t),
+                ('msg_control', ctypes.c_void_p),
+                ('msg_controllen', ctypes.c_size_t),
+                ('msg_flags', ctypes.c_int)]
+
+class MMsgHdr(ctypes.Structure):
+    # struct mmsghdr
+    _fields_ = [('msg_hdr', MsgHdr),
+                ('msg_len', ctypes.c_uint)]
+
+def buffer_pointer(packet):
+    # Get a ctypes object pointing to the packet memory (no copy)
+    # input: packet as bytes, bytearray or writable memoryview
+    # output: (ctypes object to keep alive while the address is used, address)
+
+    if isinstance(packet, bytes):
+        buffer = ctypes.c_char_p(packet)
+        return buffer, ctypes.cast(buffer, ctypes.c_void_p).value
+    buffer = (ctypes.c_char * len(packet)).from_buffer(packet)
+    return buffer, ctypes.addressof(buffer)
+
+def mmsg_build(batch):
+    # Build the sendmmsg messages of a batch, by chunks of SENDMMSG_MAX
+    # (no address: the socket is connected to its destination)
+    # input: list of packets
+    # output: list of (messages array, messages count, objects to keep alive)
+
+    chunks = []
+    iovec_size = ctypes.sizeof(IOVec)
+
+    for start in range(0, len(batch), SENDMMSG_MAX):
+        chunk = batch[start: start + SENDMMSG_MAX]
+        iovecs = (IOVec * len(chunk))()
+        msgs = (MMsgHdr * len(chunk))()
+        iovecs_address = ctypes.addressof(iovecs)
+        keep = [iovecs]
+
+        for k, packet in enumerate(chunk):
+            buffer, buffer_address = buffer_pointer(packet)
+            keep.append(buffer)
+
+            iovec = iovecs[k]
+            iovec.iov_base = buffer_address
+            iovec.iov_len = len(packet)
+            header = msgs[k].msg_hdr
+            header.msg_iov = iovecs_address + k * iovec_size
+            header.msg_iovlen = 1
+
+        chunks.append((msgs, len(chunk), keep))
+
+    return chunks
+
+def send_batch(sock, batch, batching=True):
+    # Send all the queued UDP packets with as few syscalls as possible.
+    # The messages of a batch are built once and reused as long as the
+    # same packets objects are sent (the packets are patched in place frame
+    # after frame, and every destination gets the same messages); they
+    # point to the packets memory, which keeps the cached packets alive
+    # and not resizable, so a cached key (packets ids) can't be reused by
+    # other packets. Batches of a few packets are sent one by one.
+    # input: connected socket, list of packets,
+    #        batching set to False to send packets one by one
+    # output: (number of packets sent, number of syscalls)
+
+    # Fall back to one send per packet
+    if SENDMMSG is None or not batching or len(batch) < SENDMMSG_MIN:
+        for packet in batch:
+            sock.send(packet)
+        return len(batch), len(batch)
+
+    key = tuple([id(packet) for packet in batch])
+    chunks = MMSG_CACHE.get(key)
+
+    if chunks is None:
+        if len(MMSG_CACHE) >= MMSG_CACHE_MAX:
+            MMSG_CACHE.clear()
+        chunks = MMSG_CACHE[key] = mmsg_build(batch)
+
+    sent = 0
+    calls = 0
+    fileno = sock.fileno()
+
+    for msgs, count, _ in chunks:
+        done = 0
+
+        # sendmmsg may send only part of the messages
+        while done < count:
+            result = SENDMMSG(fileno, ctypes.byref(msgs, done * ctypes.sizeof(MMsgHdr)), count - done, 0)
+            calls += 1
+
+            if result < 0:
+                errno = ctypes.get_errno()
+                raise OSError(errno, os.strerror(errno))
+
+            done += result
+
+        sent += done
+
+    return sent, calls
+
+class Destination:
+    # An Artnet node: its name is resolved once (then again every resolve
+    # interval or after an error) and it gets its own connected UDP socket,
+    # so that the sends skip the resolver, the address parsing and the
+    # route lookup, and the ICMP errors (eg. port unreachable) are reported
+    # by node.
+    # A multicast group or a broadcast address is a destination too: each
+    # packet is sent once whatever the number of receivers.
+
+    def __init__(self, host, port, interval=60, ttl=1, loop=True, interface=None):
+        # input: host name or IP address, UDP port, seconds between two
+        #        resolutions (0 resolves once), multicast TTL and loopback,
+        #        local address of the interface to send from (None for
+        #        the routing table choice)
+
+        self.host = host
+        self.port = port
+        self.interval = interval
+        self.ttl = ttl
+        self.loop = loop
+        self.interface = interface
+        self.ip = None
+        self.sock = None
+        self.pending = None     # (ip, connected socket) of a new address
+        self.retry = 0          # next resolution time
+        self.batch = []         # packets queued for the current frame
+        self.packets = 0        # packets sent
+        self.bytes = 0          # bytes sent
+        self.errors = 0         # failed sends and resolutions
+        self.failing = False    # sends failed less than RESOLVE_RETRY ago
+        self.failed = 0         # last failed send time
+        self.resolving = False  # a resolution is running
+        self.lock = threading.Lock()    # state shared with the resolution thread
+
+    def resolve(self, now):
+        # Resolve the host, a socket connected to the new address is
+        # switched to by the next send (resolutions after the startup one
+        # run in background so that a slow resolver doesn't stall frames,
+        # one at a time)
+        # input: current time (monotonic)
+
+        with self.lock:
+            current = self.pending[0] if self.pending is not None else self.ip
+
+        try:
+            ip = socket.gethostbyname(self.host)
+        except OSError as error:
+            self.fail(now, 'Cannot resolve %s: %s' % (self.host, error), now + RESOLVE_RETRY)
+            return
+
+        sock = None
+        if ip != current:
+            try:
+                sock = self.connect(ip)
+            except OSError as error:
+                self.fail(now, '%s (%s): %s' % (self.host, ip, error), now + RESOLVE_RETRY)
+                return
+            verbose_1('* Destination %s: %s' % (self.host, ip))
+
+        with self.lock:
+            self.retry = now + self.interval if self.interval > 0 else math.inf
+            if sock is not None:
+                # A new address not switched to yet is replaced
+                if self.pending is not None:
+                    self.pending[1].close()
+                self.pending = (ip, sock)
+            self.resolving = False
+
+    def connect(self, ip):
+        # input: IP address
+        # output: UDP socket connected to the address
+
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)      # UDP
+
+        try:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)   # Allow broadcast (any subnet)
+
+            if self.interface is not None:
+                sock.bind((self.interface, 0))
+
+            # Multicast group (224.0.0.0/4)
+            if 224 <= int(ip.split('.')[0]) <= 239:
+                sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, self.ttl)
+                sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_LOOP, int(self.loop))
+                if self.interface is not None:
+                    sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_IF, socket.inet_aton(self.interface))
+
+            sock.connect((ip, self.port))
+        except OSError:
+            sock.close()
+            raise
+
+        return sock
+
+    def fail(self, now, message, retry):
+        # A failed resolution: count it, write the first one of a series
+        # input: current time, error message, next resolution time
+
+        with self.lock:
+            self.retry = retry
+            self.errors += 1
+            self.failed = now
+            failing = self.failing
+            self.failing = True
+            self.resolving = False
+
+        if not failing:
+            stderr.write('\n* ' + message)
+
+    def send(self, batching=True):
+        # Send the queued packets (the queue is emptied)
+        # input: batching set to False to send packets one by one
+        # output: (number of packets sent, number of syscalls)
+
+        now = time.monotonic()
+
+        with self.lock:
+            # Switch to the socket of the new address
+            if self.pending is not None:
+                if self.sock is not None:
+                    self.sock.close()
+                self.ip, self.sock = self.pending
+                self.pending = None
+
+            if now >= self.retry and not self.resolving:
+                self.resolving = True
+                threading.Thread(target=self.resolve, args=(now,), daemon=True).start()
+
+        if self.sock is None:
+            self.batch.clear()
+            return 0, 0
+
+        try:
+            sent, calls = send_batch(self.sock, self.batch, batching)
+        except OSError as error:
+            # eg. ECONNREFUSED: an ICMP port unreachable was received for a
+            # previous packet; the name is resolved again (at most every
+            # RESOLVE_RETRY, and not while a resolution is running)
+            with self.lock:
+                self.errors += 1
+                if not self.resolving:
+                    self.retry = min(self.retry, self.failed + RESOLVE_RETRY)
+                self.failed = now
+                failing = self.failing
+                self.failing = True
+            if not failing:
+                stderr.write('\n* %s (%s): %s' % (self.host, self.ip, error))
+            self.batch.clear()
+            return 0, 1
+
+        # The errors come with every other send at best (one ICMP error is
+        # reported by send), a node is back after RESOLVE_RETRY without any
+        with self.lock:
+            recovered = self.failing and now - self.failed >= RESOLVE_RETRY
+            if recovered:
+                self.failing = False
+        if recovered:
+            stderr.write('\n* %s (%s): no more errors (%d errors)' % (self.host, self.ip, self.errors))
+
+        self.packets += sent
+        self.bytes += sum(map(len, self.batch))
+        self.batch.clear()
+        return sent, calls
+
+def shard_worker(first, last, name, connection, options):
+    # Worker process of a ShardPool: encode and send the universes first
+    # to last - 1 of every frame written in the shared memory
+    # input: universes range, shared memory name, connection to the
+    #        coordinator, options dict (see ShardPool)
+    global VERBOSE
+
+    VERBOSE = options['verbose']
+
+    memory = shared_memory.SharedMemory(name)
+    offset = calcsize(SHARD_HEADER)
+
+    # Each shard has its own sockets
+    routes = parse_destinations(options['destination'], options['port'], options['interval'],
+                                options['ttl'], options['loop'], options['interface'])
+    destinations = list(dict.fromkeys(destination for destination, _, _ in routes))
+    for destination in destinations:
+        destination.resolve(time.monotonic())
+
+    addresses = universe_routes(routes, options['start'], last)[first:]
+
+    # Preallocated ArtDMX packets of the shard universes (by frame size)
+    templates = dict()
+
+    # Last sent DMX data and time by universe (delta mode)
+    sent_last = dict()
+
+    try:
+        connection.send('ready')
+
+        # A message by frame written, None to stop
+        while connection.recv() is not None:
+            size, sequence = unpack_from(SHARD_HEADER, memory.buf, 0)
+
+            if size not in templates:
+                templates[size] = artdmx_templates(size, options['start'], options['channels'])[first:last]
+
+            packets = artdmx_encode(templates[size], memory.buf[offset + first * options['channels']: offset + size], sequence)
+
+            if options['delta'] > 0:
+                universes = delta_universes(packets, sent_last, options['keepalive'])
+            else:
+                universes = enumerate(packets)
+
+            for universe, data in universes:
+                for destination in addresses[universe]:
+                    destination.batch.append(data)
+                    for repeat in range(options['repeat']):
+                        destination.batch.append(data)
+
+            sent = calls = 0
+            for destination in destinations:
+                result = destination.send(options['batching'])
+                sent += result[0]
+                calls += result[1]
+
+            # Frame sent, with the shard totals by destination (statistics)
+            connection.send((sent, calls, {destination.host: (destination.packets, destination.bytes, destination.errors)
+                                           for destination in destinations}))
+
+    except (KeyboardInterrupt, EOFError, OSError):
+        pass
+
+    memory.close()
+
+class ShardPool:
+    # Multi-process output for the walls of several hundred universes: the
+    # output frames are written once in shared memory, then every worker
+    # process encodes and sends its own range of universes. The coordinator
+    # waits for all the shards before writing the next frame (frame
+    # barrier), so that they send the same frame with the same sequence,
+    # and the ArtSync is sent by the caller once every shard is done.
+    # Each worker has a pipe to the coordinator rather than a shared
+    # barrier: a worker that died is noticed instead of blocking the others.
+
+    def __init__(self, shards, framesize, universes, options):
+        # input: number of worker processes (at most one by universe),
+        #        largest output frame size in bytes, largest universes
+        #        count by frame, options dict: destination (list as
+        #        given to parse_destinations), port, interval, ttl,
+        #        loop, interface, start, channels, repeat, delta,
+        #        keepalive, batching and verbose
+
+        self.shards = max(1, min(shards, universes))
+        self.offset = calcsize(SHARD_HEADER)
+        self.memory = shared_memory.SharedMemory(create=True, size=self.offset + max(framesize, 1))
+
+        # The workers don't inherit the threads nor the sockets
+        context = multiprocessing.get_context('spawn')
+
+        self.workers = []
+        self.connections = []
+        self.destinations = [dict() for shard in range(self.shards)]   # packets, bytes, errors by host, by shard
+        for shard in range(self.shards):
+            first = universes * shard // self.shards
+            last = universes * (shard + 1) // self.shards
+            connection, child = context.Pipe()
+            worker = context.Process(target=shard_worker, args=(first, last, self.memory.name, child, options), daemon=True)
+            worker.start()
+            child.close()
+            self.workers.append(worker)
+            self.connections.append(connection)
+            verbose_1('* Shard %d: universes %d to %d' % (shard, options['start'] + first, options['start'] + last - 1))
+
+        # Stopped on exit too (eg. Ctrl-C)
+        atexit.register(self.close)
+
+        # Wait for the workers to be ready (destinations resolved)
+        for connection in self.connections:
+            try:
+                connection.recv()
+            except EOFError:
+                self.close()
+                raise SystemExit('* A shard worker failed to start')
+
+    def send(self, frame, sequence):
+        # Send a frame, return once all the shards sent it
+        # input: output frame, sequence index
+        # output: (number of packets sent, number of syscalls, seconds
+        #         spent sending)
+
+        start = time.monotonic()
+
+        self.memory.buf[self.offset: self.offset + len(frame)] = frame
+        pack_into(SHARD_HEADER, self.memory.buf, 0, len(frame), sequence)
+
+        sent = calls = 0
+
+        try:
+            for connection in self.connections:
+                connection.send(True)
+
+            for shard, connection in enumerate(self.connections):
+                if not connection.poll(SHARD_TIMEOUT):
+                    raise TimeoutError
+                result = connection.recv()
+                sent += result[0]
+                calls += result[1]
+                self.destinations[shard] = result[2]
+
+        except (EOFError, OSError):
+            alive = sum(worker.is_alive() for worker in self.workers)
+            self.close()
+            raise SystemExit('* A shard worker stopped (%d/%d alive)' % (alive, self.shards))
+
+        return sent, calls, time.monotonic() - start
+
+    def close(self):
+        # Stop the workers and free the shared memory
+
+        if self.memory is None:
+            return
+
+        for connection in self.connections:
+            try:
+                connection.send(None)
+            except OSError:
+                pass
+
+        for worker in self.workers:
+            worker.join(SHARD_TIMEOUT)
+            if worker.is_alive():
+                worker.terminate()
+
+        self.memory.close()
+        self.memory.unlink()
+        self.memory = None
+
+class FrameReassembler:
+    # Rebuild fixed size frames from the received UDP datagrams.
+    # Datagrams are received straight into a preallocated buffer, the bytes
+    # beyond the current frame are carried to the next one (a datagram
+    # larger than a frame can carry whole frames). The socket is non
+    # blocking: every readable event drains it.
+    # UDP does not tell where a frame starts: when the source goes idle
+    # (resync timeout) in the middle of a frame the partial frame is
+    # dropped so that the next datagram starts a new aligned frame.
+
+    def __init__(self, sock, framesize):
+        # input: bound UDP socket, frame size in bytes
+
+        self.sock = sock
+        self.sock.setblocking(False)
+        self.framesize = framesize
+        self.buffer = bytearray(framesize + MAX_DATAGRAM_SIZE)
+        self.view = memoryview(self.buffer)
+        self.filled = 0         # bytes in the buffer
+        self.carried = 0        # bytes in the buffer carried from the previous frame
+        self.idle = True        # the source went idle since the previous frame
+        self.short = 0          # frames dropped because data was missing
+        self.long = 0           # frames followed by unexpected extra data
+        self.resynced = 0       # resynchronisations on an idle source
+        self.ended = False      # the source won't send anything more
+
+    def fileno(self):
+        return self.sock.fileno()
+
+    def carry(self):
+        # Move the bytes received beyond the previous frame to buffer start
+
+        if self.filled >= self.framesize:
+            self.filled -= self.framesize
+            self.buffer[:self.filled] = bytes(self.view[self.framesize:self.framesize + self.filled])
+            self.carried = self.filled
+
+    def read(self):
+        # Receive datagrams until a frame is complete (the carried bytes
+        # may already hold one) or nothing is left to receive
+        # output: frame as a memoryview (valid until the next call)
+        #         when complete, None once drained
+
+        self.carry()
+
+        while self.filled < self.framesize:
+            try:
+                self.filled += self.sock.recv_into(self.view[self.filled:])
+            except BlockingIOError:
+                return None
+
+        self.idle = False
+
+        return self.view[:self.framesize]
+
+    def timeout(self):
+        # Nothing was received for the resync timeout
+
+        self.carry()
+
+        if self.filled == 0:
+            self.idle = True
+            return
+
+        # The source went idle in the middle of a frame
+        if self.filled == self.carried or not self.idle:
+            self.long += 1      # extra data right after the previous frame
+            verbose_1('* Resync: dropping %d extra bytes' % self.filled)
+        else:
+            self.short += 1     # the current frame lacks data
+            verbose_1('* Resync: dropping incomplete frame (%d bytes)' % self.filled)
+
+        self.resynced += 1
+        self.filled = 0
+        self.carried = 0
+        self.idle = True
+
+class StreamReassembler:
+    # Read fixed size frames from a stream: stdin (-), a named pipe
+    # (fifo:PATH) or a Unix stream socket (unix:PATH). Streams don't lose
+    # nor reorder data, the frames are read straight into the frame buffer
+    # with as few reads as the pipe or socket buffer allows, and the
+    # frames boundaries never drift.
+    # When the writer of a named pipe or Unix socket goes away the partial
+    # frame is dropped and the next writer starts a new frame, stdin ends
+    # the source.
+
+    def __init__(self, source, framesize):
+        # input: -, fifo:PATH or unix:PATH, frame size in bytes
+
+        self.source = source
+        self.framesize = framesize
+        self.buffer = bytearray(framesize)
+        self.view = memoryview(self.buffer)
+        self.filled = 0         # bytes in the buffer
+        self.short = 0          # frames dropped because the writer went away
+        self.long = 0           # (never, streams keep the frames aligned)
+        self.resynced = 0       # (never)
+        self.ended = False      # the source won't send anything more
+
+        self.file = None        # stdin or named pipe
+        self.server = None      # listening Unix socket
+        self.connection = None  # current Unix socket writer
+
+        if source == '-':
+            self.file = io.FileIO(0, 'rb', closefd=False)
+            self.pipe_size(0)
+        elif source.startswith('fifo:'):
+            self.path = source[5:]
+            if not os.path.exists(self.path):
+                os.mkfifo(self.path)
+            self.open()
+        elif source.startswith('unix:'):
+            self.path = source[5:]
+            # Left by a previous run
+            if os.path.exists(self.path) and stat.S_ISSOCK(os.stat(self.path).st_mode):
+                os.unlink(self.path)
+            self.server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self.server.bind(self.path)
+            self.server.listen(1)
+        else:
+            raise ValueError('invalid stream source %s (expected -, fifo:PATH or unix:PATH)' % source)
+
+    def open(self):
+        # Open the named pipe, without waiting for a writer
+
+        fd = os.open(self.path, os.O_RDONLY | os.O_NONBLOCK)
+        os.set_blocking(fd, True)
+        self.file = io.FileIO(fd, 'rb')
+        self.pipe_size(fd)
+
+    def pipe_size(self, fd):
+        # Larger pipe buffer (Linux only): whole frames fit in one read
+
+        import fcntl
+
+        try:
+            fcntl.fcntl(fd, fcntl.F_SETPIPE_SZ, min(max(self.framesize, 65536), MAX_PIPE_SIZE))
+        except (AttributeError, OSError):
+            pass
+
+    def fileno(self):
+        if self.server is not None:
+            return (self.connection or self.server).fileno()
+        return self.file.fileno()
+
+    def read(self):
+        # Read the available data (the stream must be readable), once by
+        # readable event
+        # output: frame as a memoryview (valid until the next call)
+        #         when complete, None otherwise
+
+        # Called again after a frame: wait for the next readable event
+        if self.filled == self.framesize:
+            self.filled = 0
+            return None
+
+        # A writer connects to the Unix socket
+        if self.server is not None and self.connection is None:
+            self.connection = self.server.accept()[0]
+            self.connection.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, min(max(self.framesize, 65536), MAX_PIPE_SIZE))
+            verbose_1('* %s: writer connected' % self.source)
+            return None
+
+        if self.connection is not None:
+            try:
+                size = self.connection.recv_into(self.view[self.filled:])
+            except ConnectionResetError:
+                size = 0        # same as a writer closing the socket
+        else:
+            size = self.file.readinto(self.view[self.filled:])
+
+        if size == 0:
+            self.end()
+            return None
+
+        self.filled += size
+
+        if self.filled < self.framesize:
+            return None
+
+        return self.view
+
+    def end(self):
+        # The writer went away
+
+        if self.filled > 0:
+            self.short += 1
+            verbose_1('* %s: writer gone, dropping incomplete frame (%d bytes)' % (self.source, self.filled))
+        self.filled = 0
+
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+        elif self.source == '-':
+            self.ended = True
+            verbose_1('* %s: end of input' % self.source)
+        else:
+            # Wait for the next writer
+            self.file.close()
+            self.open()
+
+    def timeout(self):
+        # Nothing was received for the resync timeout: a stream can't
+        # lose data, the frame is completed by the next reads
+        pass
+
+class FrameSource:
+    # A frame input of the relay and the region of the output frame it fills
+
+    def __init__(self, reassembler, region, width):
+        # input: frame reassembler, region as (x, y, width, height) in
+        #        pixels, output frame width in pixels
+
+        x, y, w, h = region
+        self.reassembler = reassembler
+        self.last = time.monotonic()    # last time data was received
+        self.fresh = False              # a new frame was received
+
+        # Rows of the source frame in the output frame as
+        # (output start, output end, source start, source end) bytes indexes
+        self.rows = [   (   ((y + row) * width + x) * 3, ((y + row) * width + x + w) * 3,
+                            row * w * 3, (row + 1) * w * 3)
+                        for row in range(h)]
+
+    def fileno(self):
+        return self.reassembler.fileno()
+
+    def composite(self, frame, output):
+        # Copy the source frame in its region of the output frame
+        # input: source frame, output frame (bytearray)
+
+        for out_start, out_end, start, end in self.rows:
+            output[out_start:out_end] = frame[start:end]
+
+def rgb2lab_array(rgb):
+    # Convert rgb colors to lab color representation (vectorized rgb2lab)
+    # Like rgb2lab the r, g, b values are used as is (not scaled to 0-1)
+    # so that the results match the colormath conversions.
+    # input: array of (r,g,b) values, shape (..., 3)
+    # output: array of (l,a,b) values, shape (..., 3)
+
+    import numpy
+
+    v = numpy.asarray(rgb, dtype=numpy.float64)
+    linear = numpy.where(v <= 0.04045, v / 12.92, numpy.power((v + 0.055) / 1.055, 2.4))
+    xyz = (linear @ numpy.array(SRGB_TO_XYZ).T) / numpy.array(D65)
+    f = numpy.where(xyz > CIE_E, numpy.cbrt(xyz), (7.787 * xyz) + (16.0 / 116.0))
+
+    return numpy.stack((    (116.0 * f[..., 1]) - 16.0,
+                            500.0 * (f[..., 0] - f[..., 1]),
+                            200.0 * (f[..., 1] - f[..., 2])), axis=-1)
+
+def xterm256_lut():
+    # Build (once) the RGB cube to xterm256 index look-up table.
+    # Each cell of the reduced resolution RGB cube (64x64x64) gets the best
+    # matching xterm256 color (Manhattan distance in lab representation)
+    # of its center color.
+    # Tolerance compared to rgb2xterm256_lab: about 8% of the colors get a
+    # neighbouring xterm256 color, 99% of the colors are within 13% of the
+    # best match Lab distance and the worst case is 2.3 times this distance.
+    # The table is saved in XTERM256_LUT_CACHE so that it is built only once.
+    # output: xterm256 indexes (uint8 array) by cube cell
+
+    global XTERM256_LUT
+
+    import numpy
+
+    levels = 1 << XTERM256_LUT_BITS
+
+    # Load the table built by a previous run
+    if XTERM256_LUT is None and os.path.isfile(XTERM256_LUT_CACHE):
+        lut = numpy.fromfile(XTERM256_LUT_CACHE, dtype=numpy.uint8)
+        if len(lut) == levels ** 3:
+            XTERM256_LUT = lut
+
+    if XTERM256_LUT is None:
+        step = 256 // levels
+        axis = numpy.arange(levels) * step + step // 2
+
+        # Center color of every cube cell as lab
+        cube = numpy.stack(numpy.meshgrid(axis, axis, axis, indexing='ij'), axis=-1).reshape(-1, 3)
+        labs = rgb2lab_array(cube).astype(numpy.float32)
+        palette = numpy.array(XTERM256LAB, dtype=numpy.float32)
+
+        lut = numpy.empty(len(labs), dtype=numpy.uint8)
+
+        # Find the best matching xterm256color (minimal distance) by chunks
+        for i in range(0, len(labs), 8192):
+            chunk = labs[i: i + 8192]
+            distances = numpy.abs(chunk[:, None, 0] - palette[None, :, 0])
+            distances += numpy.abs(chunk[:, None, 1] - palette[None, :, 1])
+            distances += numpy.abs(chunk[:, None, 2] - palette[None, :, 2])
+            lut[i: i + 8192] = distances.argmin(axis=1)
+
+        XTERM256_LUT = lut
+
+        # Save the table for the next runs (not mandatory)
+        try:
+            os.makedirs(os.path.dirname(XTERM256_LUT_CACHE), exist_ok=True)
+            lut.tofile(XTERM256_LUT_CACHE)
+        except OSError as error:
+            verbose_1('* Cannot save xterm256 look-up table: %s' % error)
+
+    return XTERM256_LUT
+
+def rgb2xterm256_frame(frame,width,height):
+    # Find best matching xterm256 colors of a whole frame using the
+    # RGB cube look-up table (see xterm256_lut)
+    # input: frame as raw rgb pixel values, frame size in pixels
+    # output: xterm256 color indexes (uint8 array, shape (height, width))
+
+    import numpy
+
+    lut = xterm256_lut()
+    shift = 8 - XTERM256_LUT_BITS
+
+    pixels = numpy.frombuffer(frame, dtype=numpy.uint8, count=width*height*3).reshape(height, width, 3)
+    cells = pixels >> shift
+    index = (cells[..., 0].astype(numpy.intp) << (2 * XTERM256_LUT_BITS)) | (cells[..., 1].astype(numpy.intp) << XTERM256_LUT_BITS) | cells[..., 2]
+
+    return lut[index]
+
+def panel_map(width, height, serpentine=False, rotate=0, flip='none'):
+    # Wiring of one panel: the LEDs are chained row after row from the
+    # top-left corner of the panel (every other row reversed when wired
+    # serpentine), then the panel is flipped and mounted rotated clockwise
+    # input: panel size in pixels (as mounted), serpentine wiring,
+    #        rotation in degrees, flip (none, horizontal, vertical, both)
+    # output: list of (x, y) pixel positions by LED
+
+    # The panel size as wired (before the rotation)
+    if rotate in (90, 270):
+        columns, rows = height, width
+    else:
+        columns, rows = width, height
+
+    positions = []
+
+    for led in range(columns * rows):
+        v, u = divmod(led, columns)
+
+        if serpentine and v % 2 == 1:
+            u = columns - 1 - u
+        if flip in ('horizontal', 'both'):
+            u = columns - 1 - u
+        if flip in ('vertical', 'both'):
+            v = rows - 1 - v
+
+        if rotate == 90:
+            positions.append((width - 1 - v, u))
+        elif rotate == 180:
+            positions.append((width - 1 - u, height - 1 - v))
+        elif rotate == 270:
+            positions.append((v, height - 1 - u))
+        else:
+            positions.append((u, v))
+
+    return positions
+
+def pixel_map(width, height, panels=(1, 1), serpentine=False, rotations=(0,), flip='none'):
+    # Source pixel of every LED, in wiring order. The frame is tiled into
+    # panels chained row after row, each one wired completely before the
+    # next one (see panel_map)
+    # input: frame size in pixels, panels as (columns, rows), serpentine
+    #        wiring, rotation of each panel (in chain order, repeated when
+    #        shorter), flip
+    # output: list of source pixel indexes
+
+    columns, rows = panels
+    panel_width = width // columns
+    panel_height = height // rows
+
+    mapping = []
+
+    for panel in range(columns * rows):
+        y0, x0 = divmod(panel, columns)
+        x0 *= panel_width
+        y0 *= panel_height
+        rotate = rotations[panel % len(rotations)]
+
+        for x, y in panel_map(panel_width, panel_height, serpentine, rotate, flip):
+            mapping.append((y0 + y) * width + x0 + x)
+
+    return mapping
+
+class PixelMapper:
+    # Reorder the frames pixels in the LEDs wiring order with one gather
+    # on a precomputed permutation (numpy when installed, otherwise a C
+    # level itemgetter on the bytes indexes)
+
+    def __init__(self, mapping):
+        # input: source pixel index by LED (see pixel_map)
+
+        self.framesize = len(mapping) * 3
+
+        try:
+            import numpy
+        except ImportError:
+            numpy = None
+
+        if numpy is not None:
+            self.index = numpy.array(mapping, dtype=numpy.intp)
+            self.out = numpy.empty((len(mapping), 3), dtype=numpy.uint8)
+            self.view = memoryview(self.out.reshape(-1))
+            self.numpy = numpy
+        else:
+            self.getter = operator.itemgetter(*[pixel * 3 + c for pixel in mapping for c in range(3)])
+            self.numpy = None
+
+    def apply(self, frame):
+        # input: frame as raw rgb pixel values
+        # output: mapped frame (the numpy output buffer is reused by the
+        #         next call), frames of another size are not mapped
+
+        if len(frame) != self.framesize:
+            return frame
+
+        if self.numpy is not None:
+            pixels = self.numpy.frombuffer(frame, dtype=self.numpy.uint8).reshape(-1, 3)
+            pixels.take(self.index, axis=0, out=self.out)
+            return self.view
+
+        return bytes(self.getter(frame))
+
+class ColorTransform:
+    # Output colors of the LEDs: gamma, brightness and per channel gain
+    # are combined into one 256 entries table by channel, then the bytes
+    # are written in the LEDs color order (eg. GRB for ws2812)
+
+    def __init__(self, gamma=1, brightness=1, gains=(1, 1, 1), order='RGB'):
+        # input: gamma, brightness (0 to 1), gain of the R, G and B
+        #        channels, LEDs color order (permutation of RGB)
+
+        self.luts = []
+        for gain in gains:
+            self.luts.append(bytes(min(255, int(255 * ((value / 255) ** gamma) * brightness * gain + 0.5)) for value in range(256)))
+
+        # Source channel of every output byte of a pixel
+        self.sources = ['RGB'.index(channel) for channel in order]
+
+        # Same table for all channels and no reordering: one translate
+        self.single = self.luts[0] == self.luts[1] == self.luts[2] and self.sources == [0, 1, 2]
+        self.out = bytearray()
+
+    def apply(self, frame):
+        # input: frame as raw rgb pixel values
+        # output: transformed frame (the output buffer is reused by the
+        #         next call when channels differ)
+
+        if not isinstance(frame, (bytes, bytearray)):
+            frame = bytes(frame)
+
+        if self.single:
+            return frame.translate(self.luts[0])
+
+        if len(self.out) != len(frame):
+            self.out = bytearray(len(frame))
+
+        end = len(frame) - len(frame) % 3
+
+        # One strided translate by channel
+        for channel, source in enumerate(self.sources):
+            self.out[channel:end:3] = frame[source:end:3].translate(self.luts[source])
+
+        return self.out
+
+def output_frame(frame, stages):
+    # Output stages of a frame, before packetization
+    # input: frame as raw rgb pixel values, list of stages (ColorTransform,
+    #        PixelMapper, WhiteChannel), in order
+    # output: frame to encode
+
+    for stage in stages:
+        frame = stage.apply(frame)
+
+    return frame
+
+def delta_universes(packets, last, keepalive):
+    # Select the universes to send: the ones whose DMX data changed since
+    # they were last sent and the ones not refreshed for keepalive seconds
+    # (so that the receivers don't time out)
+    # input: packets of the current frame (from artdmx_encode),
+    #        last sent DMX data and time by universe (dict, updated),
+    #        keepalive in seconds
+    # output: list of (universe, packet) to send
+
+    now = time.monotonic()
+    universes = []
+
+    for universe, packet in enumerate(packets):
+        dmx = memoryview(packet)[ARTDMX_HEADER_SIZE:]
+        sent = last.get(universe)
+
+        if sent is None or len(sent[0]) != len(dmx):
+            last[universe] = [bytearray(dmx), now]
+        elif sent[0] != dmx or now - sent[1] >= keepalive:
+            sent[0][:] = dmx
+            sent[1] = now
+        else:
+            continue
+
+        universes.append((universe, packet))
+
+    return universes
+
+class FrameReceiver(threading.Thread):
+    # Receive stage of the relay: frames are received in this thread and
+    # handed to the transmit stage through a bounded queue, so that a slow
+    # transmit (or show) doesn't make the socket receive buffer overflow.
+    # With several sources, an output frame is queued once every source
+    # has filled its region with a new frame (or after the composite
+    # timeout, the late regions keep their previous content).
+    # When the queue is full the overload policy applies:
+    #   drop-oldest: the oldest queued frame is dropped
+    #   drop-newest: the received frame is dropped
+    #   block: wait for room, a stream source writer then waits too (no
+    #          frame is dropped, UDP sources may overflow)
+
+    def __init__(self, sources, framesize, size=2, policy='drop-oldest',
+                 resync_timeout=0, composite_timeout=0):
+        # input: frame sources, output frame size in bytes, queue size in
+        #        frames, overload policy, resync and composite timeouts in
+        #        seconds (0 to disable)
+
+        threading.Thread.__init__(self, daemon=True)
+        self.sources = sources
+        self.output = bytearray(framesize)
+        self.frames = queue.Queue(size)
+        self.policy = policy
+        self.resync_timeout = resync_timeout
+        self.composite_timeout = composite_timeout
+        self.received = 0       # frames received
+        self.dropped = 0        # frames dropped on overload
+        self.error = None       # error that stopped the reception
+
+    def run(self):
+        # An error stops the transmit stage too, instead of leaving it
+        # waiting for frames forever
+        try:
+            self.receive()
+        except Exception as error:
+            self.error = error
+            self.frames.put((None, time.monotonic()))
+
+    def receive(self):
+        # Wake up for the timeouts only
+        timeouts = [t for t in (self.resync_timeout, self.composite_timeout) if t > 0]
+        wait = min(timeouts) if len(timeouts) > 0 else None
+
+        # First new region of the output frame reception time
+        started = None
+
+        while True:
+            # Every source ended (eg. end of stdin), the transmit stage stops
+            active = [source for source in self.sources if not source.reassembler.ended]
+            if len(active) == 0:
+                self.frames.put((None, time.monotonic()))
+                return
+
+            readable = select.select(active, [], [], wait)[0]
+            now = time.monotonic()
+
+            for source in self.sources:
+                if source in readable:
+                    source.last = now
+
+                    # Every frame received at once (until None), the output
+                    # frame is queued once every source filled its region
+                    frame = source.reassembler.read()
+                    while frame is not None:
+                        source.composite(frame, self.output)
+                        source.fresh = True
+                        if started is None:
+                            started = now
+                        if all(other.fresh for other in self.sources):
+                            self.flush(now)
+                            started = None
+                        frame = source.reassembler.read()
+
+                # Nothing received for a while, resync the source
+                elif self.resync_timeout > 0 and now - source.last >= self.resync_timeout:
+                    source.last = now
+                    source.reassembler.timeout()
+
+            # Waited long enough for the other sources
+            if started is not None and self.composite_timeout > 0 and now - started >= self.composite_timeout:
+                verbose_1('* Composite timeout: sending frame with previous regions')
+                self.flush(now)
+                started = None
+
+    def flush(self, now):
+        # Queue the output frame, the sources fill their regions again
+        # input: reception time
+
+        for source in self.sources:
+            source.fresh = False
+
+        # Copy the frame out of the output buffer
+        self.put((bytes(self.output), now))
+
+    def put(self, item):
+        # Queue a received frame (the overload policy applies when full)
+        # input: (frame as bytes, reception time)
+
+        self.received += 1
+
+        if self.policy == 'block':
+            self.frames.put(item)
+            return
+
+        try:
+            self.frames.put_nowait(item)
+            return
+        except queue.Full:
+            self.dropped += 1
+
+        if self.policy == 'drop-oldest':
+            # Only this thread puts frames, there is room after a get
+            try:
+                self.frames.get_nowait()
+            except queue.Empty:
+                pass
+            self.frames.put_nowait(item)
+
+    def get(self):
+        # Get the next received frame (waits for it)
+        # output: (frame as bytes, reception time), frame is None once
+        #         every source ended or on error (see error)
+
+        return self.frames.get()
+
 def verbose_1(msg):
     # Verbose level 1 printing
     if VERBOSE > 0:
@@ -410,32 +1921,247 @@ def frame2ascii(frame,width=0,height=0):
     # input: frame as raw rgb pixel values
     # ouput: the frame as printable colored text
 
-    ascii = ''
     if width == 0 or height ==0:
         width = int(math.sqrt(len(frame)/3))     # we assume it is a square
         height = width
-    
-    # For each frame line
-    for y in range(height):
-        # For each column
-        for x in range(width):
-
-            # Calculate the current rgb triplet pointer
-            index = y*3*width + 3*x
-            # Get the r,g,b values
-            r = int(frame[ index ])
-            g = int(frame[ index + 1 ])
-            b = int(frame[ index + 2 ])
-
-            # Convert RGB24 to xterm256 indexed color
-            color = rgb2xterm256_lab(r,g,b)
-
-            # Append pixel as a colored char (dot or square)
-            ascii += ('\033[38;5;%sm%s' % (color, PRINTCHAR))
 
-        ascii += '\n'
+    # Convert RGB24 to xterm256 indexed colors (whole frame at once)
+    colors = rgb2xterm256_frame(frame,width,height)
+
+    # Pixels as colored chars (dot or square) by xterm256 color
+    cells = ['\033[38;5;%sm%s' % (color, PRINTCHAR) for color in range(256)]
+
+    # Join each frame line
+    return ''.join(''.join(map(cells.__getitem__, line)) + '\n' for line in colors.tolist())
+
+class FrameRenderer:
+    # Show the frames on a terminal, only writing what changed: after the
+    # first frame only the cells whose xterm256 color changed are redrawn
+    # (cursor addressed) and a color escape sequence is only written when
+    # the color differs from the previous written cell.
+
+    def __init__(self, width, height):
+        # input: frame size in pixels
+
+        self.width = width
+        self.height = height
+        self.previous = None    # xterm256 colors of the shown frame
+
+        # Terminal columns used by a cell (wide chars use 2 columns)
+        self.columns = sum(2 if unicodedata.east_asian_width(char) in 'WF' else 1 for char in PRINTCHAR)
+
+    def render(self, frame):
+        # Convert a frame to the text updating the shown frame
+        # input: frame as raw rgb pixel values
+        # output: text to write on the terminal
+
+        colors = rgb2xterm256_frame(frame,self.width,self.height)
+        text = []
+        last = None
+
+        # First frame: erase the lines above and draw all the cells
+        if self.previous is None:
+            text.append((CURSOR_UP_ONE + ERASE_LINE) * self.height)
+
+            for line in colors.tolist():
+                for color in line:
+                    if color != last:
+                        text.append(COLOR % color)
+                        last = color
+                    text.append(PRINTCHAR)
+                text.append('\n')
+
+            self.previous = colors
+            return ''.join(text)
+
+        changed = colors != self.previous
+        self.previous = colors
+
+        # The cursor stays below the frame between two frames
+        for y in changed.any(axis=1).nonzero()[0].tolist():
+            text.append(CURSOR_UP % (self.height - y))
+
+            line = colors[y].tolist()
+            column = None       # next cell under the cursor
+
+            for x in changed[y].nonzero()[0].tolist():
+                if x != column:
+                    text.append(CURSOR_COLUMN % (x * self.columns + 1))
+                if line[x] != last:
+                    text.append(COLOR % line[x])
+                    last = line[x]
+                text.append(PRINTCHAR)
+                column = x + 1
+
+            text.append(CURSOR_DOWN % (self.height - y))
+
+        return ''.join(text)
+
+class Stats:
+    # Runtime statistics: cheap counters and histograms, written as one
+    # JSON line every interval on stderr, to a UDP address (HOST:PORT) or
+    # to a Unix datagram socket (unix:PATH). Values are cumulative since
+    # start. The lines are written by a timer thread, so that they keep
+    # coming when the frames stall.
+
+    def __init__(self, interval, target=None):
+        # input: seconds between two JSON lines (0 for none), target
+        #        (stderr by default)
+
+        self.interval = interval
+        self.start = time.monotonic()
+        self.lock = threading.Lock()    # the values are written by another thread
+        self.counters = dict()          # name: value
+        self.watched = dict()           # name: function returning a value counted elsewhere
+        self.destinations = dict()      # destination: [packets, bytes, errors]
+        self.histograms = dict()        # name: [counts by bucket, count, sum, max]
+        self.target = None
+        self.sock = None
+
+        if target is not None:
+            if target.startswith('unix:'):
+                self.target = target[5:]
+                self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+            else:
+                host, _, port = target.rpartition(':')
+                if host == '' or not port.isdigit():
+                    raise ValueError('invalid statistics destination %s (expected HOST:PORT or unix:PATH)' % target)
+                self.target = (host, int(port))
+                self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+        if interval > 0:
+            threading.Thread(target=self.run, daemon=True).start()
+
+    def count(self, name, value=1):
+        # Increment a counter
+
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def watch(self, name, function):
+        # Add a counter counted elsewhere, read when the statistics are written
+        # input: counter name, function returning its value
+
+        with self.lock:
+            self.watched[name] = function
+
+    def record(self, name, seconds):
+        # Add a duration to a histogram
+        # input: histogram name, duration in seconds
+
+        ms = seconds * 1000
+        with self.lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = [[0] * (len(STATS_BUCKETS) + 1), 0, 0, 0]
+
+            histogram[0][bisect.bisect_left(STATS_BUCKETS, ms)] += 1
+            histogram[1] += 1
+            histogram[2] += ms
+            histogram[3] = max(histogram[3], ms)
+
+    def sent(self, destination, pool=None):
+        # Packets and bytes sent to a destination, and its errors
+        # input: Destination, ShardPool whose workers also send to it
+
+        values = [destination.packets, destination.bytes, destination.errors]
+
+        if pool is not None:
+            for shard in pool.destinations:
+                values = [value + other for value, other in zip(values, shard.get(destination.host, (0, 0, 0)))]
+
+        with self.lock:
+            self.destinations[destination.host] = values
+
+    def run(self):
+        # Write the statistics every interval
+
+        deadline = self.start
+        while True:
+            deadline += self.interval
+            time.sleep(max(deadline - time.monotonic(), 0))
+            self.write()
+
+    def write(self):
+        # Write the statistics now
+
+        now = time.monotonic()
+        with self.lock:
+            counters = dict(self.counters)
+            for name, function in self.watched.items():
+                counters[name] = function()
+            line = json.dumps({
+                'uptime': round(now - self.start, 3),
+                'counters': counters,
+                'destinations': {   destination: {'packets': values[0], 'bytes': values[1], 'errors': values[2]}
+                                    for destination, values in self.destinations.items()},
+                'histograms': {     name: {'buckets_ms': STATS_BUCKETS, 'counts': values[0],
+                                           'count': values[1], 'sum_ms': round(values[2], 3), 'max_ms': round(values[3], 3)}
+                                    for name, values in self.histograms.items()},
+                })
+
+        if self.sock is None:
+            stderr.write(line + '\n')
+            stderr.flush()
+            return
+
+        try:
+            self.sock.sendto(line.encode(), self.target)
+        except OSError as error:
+            verbose_1('* Cannot send statistics: %s' % error)
+
+class FramePreview(threading.Thread):
+    # Show the frames in a background thread so that a slow terminal
+    # doesn't delay the packets. Only the latest frame is shown: the
+    # frames given while the terminal is busy are skipped.
+
+    def __init__(self, renderer, fps=0):
+        # input: frame renderer, maximum frames shown per second (0 for no limit)
+
+        threading.Thread.__init__(self, daemon=True)
+        self.renderer = renderer
+        self.period = 1 / fps if fps > 0 else 0
+        self.condition = threading.Condition()
+        self.frame = None       # latest frame to show
+        self.running = True
+        self.skipped = 0        # frames not shown
+
+    def show(self, frame):
+        # Give the latest frame to show (returns immediately)
+        # input: frame as raw rgb pixel values (must not be modified)
+
+        with self.condition:
+            if self.frame is not None:
+                self.skipped += 1
+            self.frame = frame
+            self.condition.notify()
+
+    def close(self):
+        # Show the last given frame and stop
+
+        with self.condition:
+            self.running = False
+            self.condition.notify()
+        self.join()
+
+    def run(self):
+        while True:
+            with self.condition:
+                while self.frame is None and self.running:
+                    self.condition.wait()
+                if self.frame is None:
+                    return
+                frame = self.frame
+                self.frame = None
+
+            start = time.monotonic()
+            stdout.write(self.renderer.render(frame))
+            stdout.flush()
 
-    return ascii
+            # Limit the frames shown per second
+            wait = self.period - (time.monotonic() - start)
+            if wait > 0:
+                time.sleep(wait)
 
 def main():
     global VERBOSE
@@ -449,40 +2175,190 @@ def main():
     parser.add_argument('-v','--verbose',action='count',default=0,help='Verbose level (on stderr)')
     parser.add_argument('-W','--width',type=int,default=16,help='Frame width in pixels')
     parser.add_argument('-H','--height',type=int,default=16,help='Frame height in pixels')
-    parser.add_argument('-d','--destination',default=['127.0.0.1'],action='extend',nargs='+',help='IP destination address (default 127.0.0.1). Multiple unicast adresses can be provided.')
+    parser.add_argument('-d','--destination',default=None,action='extend',nargs='+',help='IP destination address (default 127.0.0.1). Multiple unicast, broadcast or multicast adresses can be provided, HOST:FIRST-LAST only receives the universes FIRST to LAST.')
     parser.add_argument('-p','--port',type=int,default=6454,help='UDP destination port (default 6454)')
     parser.add_argument('-l','--listen-port',type=int,default=1234,help='UDP listen port (default 1234)')
+    parser.add_argument('-i','--source',action='append',default=[],help='Frame source and region of the frame it fills, as SOURCE[:WIDTHxHEIGHT+X+Y] (eg. 1234:32x32+32+0, the whole frame by default). SOURCE is a UDP listen port, - for stdin, fifo:PATH for a named pipe (created if needed) or unix:PATH for a Unix stream socket. Can be repeated, replaces --listen-port')
+    parser.add_argument('-c','--composite-timeout',type=float,default=0.1,help='With several sources, seconds to wait for all of them before sending a frame (default 0.1, 0 to wait forever)')
+    parser.add_argument('-R','--resolve-interval',type=float,default=60,help='Seconds between two resolutions of the destinations names, also resolved again after an error (default 60, 0 resolves once)')
+    parser.add_argument('--multicast-ttl',type=int,default=1,help='TTL of the packets sent to multicast groups (default 1, local network)')
+    parser.add_argument('--no-multicast-loop',action='count',default=0,help='Do not receive the packets sent to multicast groups on this host')
+    parser.add_argument('-I','--interface',default=None,help='Local IP address of the interface to send from, eg. for multicast or broadcast destinations (default from the routing table)')
     parser.add_argument('-r','--repeat',type=int,default=0,help='UDP packet repeat (default none)')
+    parser.add_argument('-D','--delta',action='count',default=0,help='Only send the universes whose data changed')
+    parser.add_argument('-k','--keepalive',type=float,default=1,help='With --delta, seconds between two sendings of an unchanged universe (default 1)')
+    parser.add_argument('-S','--sync',action='count',default=0,help='Send an ArtSync packet after each frame so that all universes are shown at once')
+    parser.add_argument('-B','--no-batch',action='count',default=0,help='Send UDP packets one by one instead of batching them (sendmmsg, for batches of 6 packets or more by destination)')
+    parser.add_argument('--shards',type=int,default=0,help='Encode and send the universes with SHARDS worker processes, each one sending its own range of universes (default 0, none)')
+    parser.add_argument('-t','--resync-timeout',type=float,default=0.01,help='Idle time in seconds that drops an incomplete frame to resync (default 0.01, 0 to disable)')
+    parser.add_argument('-q','--queue-size',type=int,default=2,help='Received frames waiting to be sent (default 2)')
+    parser.add_argument('-o','--overload',choices=['drop-oldest','drop-newest','block'],default='drop-oldest',help='Frame to drop when the queue is full, or block to make a stream source writer wait (default drop-oldest)')
     parser.add_argument('-F','--frames',type=int,default=0,help='Number of frames to forward before exit (infinite by default)')
+    parser.add_argument('--serpentine',action='count',default=0,help='LEDs wired serpentine: every other row reversed')
+    parser.add_argument('--rotate',default='0',help='Panels mounted rotated clockwise by 0, 90, 180 or 270 degrees, one value or one per panel separated by commas (default 0)')
+    parser.add_argument('--flip',choices=['none','horizontal','vertical','both'],default='none',help='Panels wired mirrored (default none)')
+    parser.add_argument('--panels',default='1x1',help='Frame tiled in COLUMNSxROWS panels chained row after row, each one wired completely before the next (default 1x1)')
+    parser.add_argument('--start-universe',type=int,default=0,help='Universe of the first frame bytes (default 0)')
+    parser.add_argument('--channels',type=int,default=DMX_UNIVERSE_SIZE,help='DMX channels per universe, even, up to 512 (default 510, 170 RGB pixels)')
+    parser.add_argument('--pixel-bytes',type=int,choices=[3,4],default=3,help='Bytes per pixel: 3 for RGB, 4 for RGBW LEDs (white is 0) (default 3)')
+    parser.add_argument('--gamma',type=float,default=1,help='LEDs gamma correction (default 1, none, ws2812 strips look better with 2.2 to 2.8)')
+    parser.add_argument('--brightness',type=float,default=1,help='Brightness cap from 0 to 1 (default 1)')
+    parser.add_argument('--gain',default='1,1,1',help='Red, green and blue gains separated by commas (default 1,1,1)')
+    parser.add_argument('--color-order',choices=['RGB','RBG','GRB','GBR','BRG','BGR'],default='RGB',help='LEDs color order (default RGB, GRB for most ws2812)')
+    parser.add_argument('-T','--stats',type=float,default=0,help='Write statistics as a JSON line every STATS seconds (default 0, none)')
+    parser.add_argument('--stats-to',default=None,help='Statistics destination: HOST:PORT (UDP) or unix:PATH (Unix datagram socket), stderr by default')
     parser.add_argument('-s','--show',action='count',default=0,help='Show frames (on stdout)')
+    parser.add_argument('-P','--preview-fps',type=float,default=0,help='Maximum frames shown per second (no limit by default)')
     parser.add_argument('-b','--box',action='count',default=0,help='Use boxes instead of dots when showing frames')
 
     args = parser.parse_args()
 
+    if args.queue_size < 1:
+        parser.error('queue size must be at least 1')
+
     VERBOSE = args.verbose
 
     if args.box > 0:
         PRINTCHAR = BOX
 
-    # Open UDP socket for sending Artnet data
-    udpclient = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)      # UDP
-
-    for _,destination in enumerate(args.destination):
-        if len(destination.split('.')) == 4 and int(destination.split('.')[3]) == 255:
-            udpclient.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)   # Allow multicast
-            break
-
-    # Open UDP socket for receiving raw data
-    udpserver = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)      # UDP
-
-    ## udpserver.settimeout(None)
-    udpserver.bind(('127.0.0.1', args.listen_port))
+    # Output colors (gamma, brightness, gains, color order), precomputed once
+    color = None
+    try:
+        gains = tuple(float(gain) for gain in args.gain.split(','))
+    except ValueError:
+        gains = ()
+    if len(gains) != 3 or min(gains) < 0:
+        parser.error('invalid gain %s (expected 3 positive values separated by commas)' % args.gain)
+    if args.gamma <= 0 or not 0 <= args.brightness <= 1:
+        parser.error('gamma must be greater than 0 and brightness between 0 and 1')
+
+    if args.gamma != 1 or args.brightness != 1 or gains != (1, 1, 1) or args.color_order != 'RGB':
+        color = ColorTransform(args.gamma, args.brightness, gains, args.color_order)
+        verbose_1('* Output colors: gamma %g, brightness %g, gain %s, order %s' % (args.gamma, args.brightness, args.gain, args.color_order))
+
+    # Pixel mapping (LEDs wiring order), precomputed once
+    mapper = None
+    panels = re.fullmatch(r'(\d+)x(\d+)', args.panels)
+    if panels is None or int(panels.group(1)) == 0 or int(panels.group(2)) == 0:
+        parser.error('invalid panels %s (expected COLUMNSxROWS)' % args.panels)
+    panels = (int(panels.group(1)), int(panels.group(2)))
+    if args.width % panels[0] != 0 or args.height % panels[1] != 0:
+        parser.error('%dx%d frames cannot be tiled in %dx%d panels' % (args.width, args.height, panels[0], panels[1]))
+    rotations = tuple(int(rotate) for rotate in args.rotate.split(',') if rotate.isdigit() and int(rotate) in (0, 90, 180, 270))
+    if len(rotations) != len(args.rotate.split(',')):
+        parser.error('invalid rotate %s (expected 0, 90, 180 or 270 degrees)' % args.rotate)
+
+    if args.serpentine > 0 or args.flip != 'none' or panels != (1, 1) or any(rotations):
+        mapper = PixelMapper(pixel_map(args.width, args.height, panels, args.serpentine > 0, rotations, args.flip))
+        verbose_1('* Pixel mapping: %dx%d panels, serpentine %d, rotate %s, flip %s' % (panels[0], panels[1], args.serpentine, args.rotate, args.flip))
+
+    # Output stages of the frames, in order
+    stages = [stage for stage in (color, mapper) if stage is not None]
+    if args.pixel_bytes == 4:
+        stages.append(WhiteChannel())
+
+    # Universe layout and the universes each destination receives
+    if not 2 <= args.channels <= 512 or args.channels % 2 != 0:
+        parser.error('channels must be an even number from 2 to 512')
+    if args.channels % args.pixel_bytes != 0:
+        verbose_1('* %d channels per universe: pixels are split across universes' % args.channels)
+    # The default destination is not kept when destinations are given
+    if args.destination is None:
+        args.destination = ['127.0.0.1']
+    try:
+        routes = parse_destinations(args.destination, args.port, args.resolve_interval,
+                                    args.multicast_ttl, args.no_multicast_loop == 0, args.interface)
+    except ValueError as error:
+        parser.error(str(error))
+
+    # The sockets of the destinations are bound to the interface address
+    if args.interface is not None:
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        try:
+            sock.bind((args.interface, 0))
+        except OSError as error:
+            parser.error('invalid interface address %s: %s' % (args.interface, error))
+        finally:
+            sock.close()
+
+    # Resolve the destinations once, each one gets its own connected UDP socket
+    destinations = list(dict.fromkeys(destination for destination, _, _ in routes))
+    for destination in destinations:
+        destination.resolve(time.monotonic())
 
     # Calculate framesize (in bytes)
     framesize = args.width * args.height * 3
 
-    # Precompute erase frame pattern
-    erase_frame  = (CURSOR_UP_ONE + ERASE_LINE) * args.height
+    # By default a single source fills the whole frame
+    regions = []
+    for source in args.source:
+        match = re.fullmatch(r'(.+?)(?::(\d+)x(\d+)\+(\d+)\+(\d+))?', source)
+        if match is None or not (match.group(1).isdigit() or match.group(1) == '-' or match.group(1).startswith(('fifo:', 'unix:'))):
+            parser.error('invalid source %s (expected SOURCE[:WIDTHxHEIGHT+X+Y])' % source)
+        if match.group(2) is None:
+            w, h, x, y = args.width, args.height, 0, 0
+        else:
+            w, h, x, y = map(int, match.groups()[1:])
+        if x + w > args.width or y + h > args.height:
+            parser.error('source %s is out of the frame' % source)
+        regions.append((match.group(1), (x, y, w, h)))
+
+    if len(regions) == 0:
+        regions.append((str(args.listen_port), (0, 0, args.width, args.height)))
+
+    # Open the sources (UDP sockets, stdin, named pipes or Unix sockets)
+    # and rebuild frames from the received data (receive stage)
+    sources = []
+    for source, region in regions:
+        if source.isdigit():
+            udpserver = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)      # UDP
+            udpserver.bind(('127.0.0.1', int(source)))
+            reassembler = FrameReassembler(udpserver, region[2] * region[3] * 3)
+        else:
+            # stdin, named pipe or Unix socket
+            reassembler = StreamReassembler(source, region[2] * region[3] * 3)
+        sources.append(FrameSource(reassembler, region, args.width))
+
+    receiver = FrameReceiver(sources, framesize, args.queue_size, args.overload,
+                             args.resync_timeout, args.composite_timeout)
+
+    # Preallocate the ArtDMX packets of a frame
+    templates = artdmx_templates(framesize // 3 * args.pixel_bytes, args.start_universe, args.channels)
+
+    # Destinations of every universe
+    addresses = universe_routes(routes, args.start_universe, len(templates))
+
+    # Sharded output: worker processes encode and send the universes,
+    # this process only writes the frames and sends the ArtSync packets
+    pool = None
+    if args.shards < 0:
+        parser.error('shards must be 0 or more')
+    if args.shards > 0:
+        pool = ShardPool(args.shards, framesize // 3 * args.pixel_bytes, len(templates), {
+                    'destination': args.destination, 'port': args.port, 'interval': args.resolve_interval,
+                    'ttl': args.multicast_ttl, 'loop': args.no_multicast_loop == 0, 'interface': args.interface,
+                    'start': args.start_universe, 'channels': args.channels, 'repeat': args.repeat,
+                    'delta': args.delta, 'keepalive': args.keepalive, 'batching': args.no_batch == 0,
+                    'verbose': VERBOSE})
+
+    # Last sent DMX data and time by universe (delta mode)
+    last = dict()
+
+    # Runtime statistics (the receive counters are read when written)
+    try:
+        stats = Stats(args.stats, args.stats_to)
+    except ValueError as error:
+        parser.error(str(error))
+    stats.watch('frames_in', lambda: receiver.received)
+    stats.watch('frames_dropped', lambda: receiver.dropped)
+    stats.watch('frames_short', lambda: sum(source.reassembler.short for source in sources))
+    stats.watch('frames_long', lambda: sum(source.reassembler.long for source in sources))
+    stats.watch('frames_resynced', lambda: sum(source.reassembler.resynced for source in sources))
+
+    # Show the frames changes only, in background
+    preview = FramePreview(FrameRenderer(args.width,args.height), args.preview_fps)
+    if args.show > 0:
+        preview.start()
 
     # First frame will use sequence 0
     sequence = 0
@@ -495,6 +2371,9 @@ def main():
 
     verbose_1('=' * 80)
 
+    # Start the receive stage, this thread is the transmit stage
+    receiver.start()
+
     # Forever loop
     while True:
 
@@ -504,7 +2383,6 @@ def main():
             stdout.write('\rSending frames %s' % INDICATOR[i  % len(INDICATOR)])
 
         i = (i + 1)
-        frame = b''
 
         # Receive all the udp payload for the current frame
         # UDP is not reliable so it should only works on localhost
@@ -513,62 +2391,98 @@ def main():
         # is used over the network or you may use an ffmpeg chaining
         # like this:
         # ffmpeg -> RTP or MPEGTS over network -> ffmpeg -> UDP raw
-        while len(frame) < framesize:
-            frame += udpserver.recvfrom(1500)[0]
+        frame, received = receiver.get()
+        if frame is None:
+            if receiver.error is not None:
+                raise SystemExit('* Receive error: %s' % receiver.error)
+            verbose_1('* All the sources ended')
+            break
+        verbose_1('* Frames short: %d, long: %d, resynced: %d, dropped: %d' % (
+                    sum(source.reassembler.short for source in sources),
+                    sum(source.reassembler.long for source in sources),
+                    sum(source.reassembler.resynced for source in sources),
+                    receiver.dropped))
+
+        # Stages timing (latency from frame reception)
+        dequeued = time.monotonic()
 
-        # First Artnet payload for a frame is in universe 0
-        universe = 0
-        
         # Get the frame size
-        remaining_bytes = len(frame)
+        remaining_bytes = framesize // 3 * args.pixel_bytes
 
         verbose_1('* Processing frame %d, %d bytes to send' % (i, remaining_bytes))
         if args.show > 0:
-            stdout.write(erase_frame)
-            stdout.write(frame2ascii(frame,args.width,args.height))
-            stdout.flush()
-
-        # While data needs to be sent for the current frame
-        while remaining_bytes > 0:
-
-            verbose_1('+' + '-' * 79)
-            verbose_2('+ %d bytes remaining to send' % remaining_bytes)
-
-            # Prepare up to 170 RGB values to send (510 bytes, maximum in DMX512)
-            index = universe * 510
-            rgbvalues = frame[index: index + 510]
-        
-            # Build the artnet payload
-            data = ARTNET_DESCRIPTOR_HEADER                     # Pack header first
-            data += pack('>B',sequence)                         # Pack the sequence index
-            data += pack('>B',ARTNET_PHYSICAL)                  # Pack the artnet physical
-            data += pack('<H',universe)                         # Pack the universe index
-            data += pack('>H',len(rgbvalues))                   # Pack the artnet payload length
-            data += pack('>%sB' % len(rgbvalues), *rgbvalues)   # Pack the payload
-
-            verbose_1('+ Sequence: %d, universe: %d, DMX: %d bytes, UDP payload: %d bytes' % (sequence,universe,len(rgbvalues),len(data)))
-            verbose_3('-----BEGIN PAYLOAD-----')
-            verbose_3(data.hex())
-            verbose_3('-----END PAYLOAD-----')
-            verbose_2('+ Sending UDP packet with %d bytes' % len(data))
-
-            for _,destination in enumerate(args.destination):
-                # Send the artnet data in UDP packet to destination
-                udpclient.sendto(data,(destination,args.port))
+            preview.show(frame)
+
+        shown = time.monotonic()
+
+        # The shards encode and send the universes (all of them are sent on return)
+        if pool is not None:
+            sharded = pool.send(output_frame(frame, stages), sequence)
+            universes = []
+        else:
+            sharded = (0, 0, 0)
+
+            # Patch the frame ArtDMX packets (up to 510 bytes of RGB values each)
+            packets = artdmx_encode(templates, output_frame(frame, stages), sequence)
+
+            # Select the universes to send (all of them or only the changed ones)
+            if args.delta > 0:
+                universes = delta_universes(packets, last, args.keepalive)
+                verbose_1('+ Delta: %d/%d universes to send' % (len(universes), len(packets)))
+            else:
+                universes = enumerate(packets)
+
+        # Send every universe packet of the current frame
+        for universe, data in universes:
+
+            if VERBOSE > 0:
+                verbose_1('+' + '-' * 79)
+                verbose_2('+ %d bytes remaining to send' % (remaining_bytes - universe * args.channels))
+                verbose_1('+ Sequence: %d, universe: %d, DMX: %d bytes, UDP payload: %d bytes' % (sequence,args.start_universe + universe,len(data) - ARTDMX_HEADER_SIZE,len(data)))
+                verbose_3('-----BEGIN PAYLOAD-----')
+                verbose_3(data.hex())
+                verbose_3('-----END PAYLOAD-----')
+                verbose_2('+ Sending UDP packet with %d bytes' % len(data))
+
+            for destination in addresses[universe]:
+                # Queue the artnet data in UDP packet to destination
+                destination.batch.append(data)
 
                 # When requested resend the UDP packet
                 # May be usefull in case of bad network quality
                 for repeat in range(args.repeat):
-                    verbose_2('+ Sending again UDP packet (repeat %d)' % repeat)
-                    udpclient.sendto(data,(destination,args.port))
+                    if VERBOSE > 1:
+                        verbose_2('+ Sending again UDP packet (repeat %d)' % repeat)
+                    destination.batch.append(data)
+
+        # Once all the universes are received, make the receivers show the frame
+        # (the frame UDP packets and the ArtSync are sent in one burst)
+        if args.sync > 0:
+            verbose_2('+ Sending ArtSync UDP packet')
+            for destination in destinations:
+                destination.batch.append(ARTSYNC_PACKET)
+
+        # Send all the UDP packets of the current frame at once
+        encoded = time.monotonic()
+        sent, calls, shard_time = sharded
+        for destination in destinations:
+            result = destination.send(args.no_batch == 0)
+            if args.stats > 0:
+                stats.sent(destination, pool)
+            sent += result[0]
+            calls += result[1]
+        verbose_1('+ Sent %d UDP packets with %d syscalls' % (sent, calls))
+
+        sent_time = time.monotonic()
+        verbose_1('+ Latency: queue %f, show %f, encode %f, send %f, total %f seconds' % (dequeued - received, shown - dequeued, encoded - shown - shard_time, sent_time - encoded + shard_time, sent_time - received))
+
+        if args.stats > 0:
+            stats.count('frames_out')
+            stats.count('packets', sent)
+            stats.record('queue', dequeued - received)
+            stats.record('send', sent_time - encoded + shard_time)
+            stats.record('latency', sent_time - received)
 
-            # Increment universe index for the remaining bytes to be send in other
-            # Artnet packet with the same sequence index
-            universe = (universe + 1) % 65536
-
-            # Calculate the remaining bytes to send
-            remaining_bytes -= 510
-        
         verbose_1('+' + '-' * 79)
 
         # Increment sequence index for next frame
@@ -581,5 +2495,12 @@ def main():
         if nframes == 0:   
             break
 
+    if pool is not None:
+        pool.close()
+
+    # Wait for the last frame to be shown
+    if args.show > 0:
+        preview.close()
+
 if __name__ == '__main__':
     main()
\ No newline at end of file
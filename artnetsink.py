@@ -0,0 +1,321 @@
+#!/usr/bin/env python3
+
+from struct import unpack_from      # Usefull to play with bytes
+import socket                       # UDP
+import time                         # monotonic clock (rates, jitter)
+from sys import stdout, stderr      # reports and verbose messages
+import argparse                     # for the command line arguments
+import json                         # machine readable reports
+import math
+
+# Artnet stuffs
+ARTNET_DESCRIPTOR_HEADER = b'Art-Net\x00'          # Art-Net
+ARTNET_OPCODE_ARTDMX = 0x5000                       # OpCode ArtDMX
+ARTNET_OPCODE_ARTSYNC = 0x5200                      # OpCode ArtSync
+ARTDMX_SEQUENCE_OFFSET = 12 # Sequence byte position in ArtDMX packet
+ARTDMX_HEADER_SIZE = 18     # ArtDMX header size (DMX data starts here)
+DMX_UNIVERSE_SIZE = 510     # 170 RGB values per universe (510 bytes, maximum in DMX512)
+MAX_DATAGRAM_SIZE = 65536   # Largest UDP datagram
+
+# Nothing very important here
+VERBOSE=0                   # verbose level
+
+def verbose_1(msg):
+    # Verbose level 1 printing
+    if VERBOSE > 0:
+        stderr.write('\033[38;5;230m\n' + msg)
+
+def verbose_2(msg):
+    # Verbose level 2 printing
+    if VERBOSE > 1:
+        stderr.write('\033[38;5;190m\n' + msg)
+
+class FrameCounter:
+    # Rebuild the frames from the ArtDMX packets and count what went wrong.
+    # The packets of a frame share the same sequence number, a frame ends
+    # when a packet of another sequence or an ArtSync is received. Without
+    # sequence (always 0) a frame ends when one of its universes is received
+    # again, other than the last one (repeats are sent right after).
+    # In delta mode (artnetsend.py -D) only the changed universes are sent:
+    # the missing universes keep their previous data and a sequence gap is
+    # a run of unchanged frames, neither of them is counted as lost.
+
+    def __init__(self, universes=0, framesize=0, start=0, channels=DMX_UNIVERSE_SIZE, delta=False):
+        # input: expected universes by frame (0 learns it from the
+        #        received frames), frame size in bytes to rebuild the
+        #        frames data (0 for none), first universe and channels
+        #        per universe of the frames, delta mode sender
+
+        self.universes = universes
+        self.first = start      # first universe of the frames
+        self.channels = channels
+        self.learn = universes == 0
+        self.delta = delta
+        self.framesize = framesize
+        self.frame = bytearray(framesize)
+        self.frames = []        # rebuilt frames data (taken by the caller)
+        self.closed = 0         # frames received since start
+
+        self.sequenced = False  # a non zero sequence was received
+        self.sequence = None    # current frame sequence
+        self.received = set()   # universes of the current frame
+        self.last = -1          # last universe of the current frame
+        self.start = None       # current frame first packet time
+        self.previous = None    # previous frame first packet time
+
+        self.reset()
+
+    def reset(self):
+        # Start a new reporting interval
+
+        self.counts = {
+            'packets': 0,
+            'bytes': 0,
+            'frames': 0,
+            'syncs': 0,
+            'lost_packets': 0,      # universes missing from the frames
+            'lost_frames': 0,       # sequence numbers never received
+            'unchanged_frames': 0,  # sequence numbers never received (delta mode)
+            'duplicates': 0,        # universes received twice in a frame (--repeat)
+            'out_of_order': 0,      # universes received after a higher one, or late
+            'incomplete': 0,        # frames missing universes
+            'ignored': 0,           # not ArtDMX/ArtSync packets
+            }
+        self.intervals = []     # time between two frames starts
+
+    def close(self):
+        # End the current frame
+
+        if self.start is None:
+            return
+
+        if self.learn:
+            self.universes = max(self.universes, len(self.received))
+
+        missing = self.universes - len(self.received)
+        if missing > 0 and not self.delta:
+            self.counts['lost_packets'] += missing
+            self.counts['incomplete'] += 1
+            verbose_1('* Frame %s: %d universes missing' % (self.sequence, missing))
+
+        if self.previous is not None:
+            self.intervals.append(self.start - self.previous)
+
+        if self.framesize > 0:
+            self.frames.append(bytes(self.frame))
+
+        self.counts['frames'] += 1
+        self.closed += 1
+        self.previous = self.start
+        self.start = None
+        self.received.clear()
+        self.last = -1
+
+    def sync(self):
+        # ArtSync: the receivers show the frame
+
+        self.counts['syncs'] += 1
+        self.close()
+
+    def dmx(self, sequence, universe, data, now):
+        # ArtDMX packet
+        # input: sequence, universe, DMX data, reception time
+
+        if sequence != 0:
+            self.sequenced = True
+
+        if self.sequenced and self.sequence is not None and sequence != self.sequence:
+            gap = (sequence - self.sequence - 1) % 256
+
+            # Older sequence: a late packet of a previous frame
+            if gap >= 128:
+                self.counts['out_of_order'] += 1
+                verbose_2('* Late packet: sequence %d, universe %d' % (sequence, universe))
+                return
+
+            self.close()
+            if self.delta:
+                # The unchanged frames are the previous one again
+                self.counts['unchanged_frames'] += gap
+                if self.framesize > 0:
+                    self.frames.extend([bytes(self.frame)] * gap)
+            else:
+                self.counts['lost_frames'] += gap
+
+        # Without sequence, the same universe again right away is a repeat
+        elif not self.sequenced and universe in self.received and universe != self.last:
+            self.close()
+
+        if universe in self.received:
+            self.counts['duplicates'] += 1
+            return
+
+        if universe < self.last:
+            self.counts['out_of_order'] += 1
+            verbose_2('* Out of order: universe %d after %d' % (universe, self.last))
+
+        if self.start is None:
+            self.start = now
+
+        self.sequence = sequence
+        self.received.add(universe)
+        self.last = max(self.last, universe)
+
+        index = (universe - self.first) * self.channels
+        if 0 <= index < self.framesize:
+            self.frame[index: index + len(data)] = data[:self.framesize - index]
+
+    def report(self, duration):
+        # Counts and rates of the interval
+        # input: interval duration in seconds
+        # output: dict
+
+        report = dict(self.counts)
+        report['duration'] = round(duration, 3)
+        report['fps'] = round(self.counts['frames'] / duration, 2) if duration > 0 else 0
+        report['pps'] = round(self.counts['packets'] / duration, 1) if duration > 0 else 0
+        report['universes'] = self.universes
+
+        # Inter frame jitter: deviation of the intervals between frames
+        if self.intervals:
+            mean = sum(self.intervals) / len(self.intervals)
+            deviations = [abs(interval - mean) for interval in self.intervals]
+            report['interval_ms'] = round(mean * 1000, 3)
+            report['jitter_ms'] = round(math.sqrt(sum(d * d for d in deviations) / len(deviations)) * 1000, 3)
+            report['max_jitter_ms'] = round(max(deviations) * 1000, 3)
+
+        return report
+
+def report_text(report):
+    # Human readable report line
+    # input: report dict
+    # output: text
+
+    text = '%(fps)8.2f fps %(pps)10.1f pps  frames %(frames)d  lost packets %(lost_packets)d  lost frames %(lost_frames)d  ' \
+           'duplicates %(duplicates)d  out of order %(out_of_order)d' % report
+    if 'jitter_ms' in report:
+        text += '  jitter %(jitter_ms).3f ms (max %(max_jitter_ms).3f ms)' % report
+    return text
+
+def main():
+    global VERBOSE
+
+    parser = argparse.ArgumentParser(
+                    prog='artnetsink.py',
+                    description='Receive Artnet packets and report frame rate, loss, ordering, duplicates and jitter',
+                    epilog='Made with ♥ in Python')
+
+    parser.add_argument('-v','--verbose',action='count',default=0,help='Verbose level (on stderr)')
+    parser.add_argument('-W','--width',type=int,default=0,help='Frame width in pixels (the expected universes are learnt by default)')
+    parser.add_argument('-H','--height',type=int,default=0,help='Frame height in pixels')
+    parser.add_argument('--start-universe',type=int,default=0,help='Universe of the first frame bytes (default 0)')
+    parser.add_argument('--channels',type=int,default=DMX_UNIVERSE_SIZE,help='DMX channels per universe (default 510)')
+    parser.add_argument('--pixel-bytes',type=int,choices=[3,4],default=3,help='Bytes per pixel: 3 for RGB, 4 for RGBW (default 3)')
+    parser.add_argument('-a','--address',default='0.0.0.0',help='IP address to listen on (default 0.0.0.0)')
+    parser.add_argument('-g','--group',action='extend',nargs='+',default=[],help='Multicast group to join (several groups can be provided)')
+    parser.add_argument('-l','--listen-port',type=int,default=6454,help='UDP port to listen on (default 6454)')
+    parser.add_argument('-i','--interval',type=float,default=1,help='Seconds between two reports (default 1)')
+    parser.add_argument('-F','--frames',type=int,default=0,help='Number of frames to receive before exit (infinite by default)')
+    parser.add_argument('-o','--output',default=None,help='Write the rebuilt frames (raw rgb24, or rgbw) to a file, needs --width and --height')
+    parser.add_argument('-j','--json',action='count',default=0,help='Write the reports as JSON lines')
+    parser.add_argument('-D','--delta',action='count',default=0,help='The sender only sends the changed universes (artnetsend.py -D): missing universes and sequence gaps are unchanged data, not losses')
+
+    args = parser.parse_args()
+
+    VERBOSE = args.verbose
+
+    framesize = args.width * args.height * args.pixel_bytes
+    universes = math.ceil(framesize / args.channels)
+
+    if args.output is not None and framesize == 0:
+        parser.error('--output needs --width and --height')
+
+    counter = FrameCounter(universes, framesize if args.output is not None else 0, args.start_universe, args.channels, args.delta > 0)
+    total = FrameCounter(universes, delta=args.delta > 0)
+
+    udpserver = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    udpserver.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    udpserver.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 8 * 1024 * 1024)
+    udpserver.bind((args.address, args.listen_port))
+    for group in args.group:
+        # Join the group on the interface of the listening address (any by default)
+        udpserver.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, socket.inet_aton(group) + socket.inet_aton(args.address))
+    udpserver.settimeout(args.interval)
+
+    output = open(args.output, 'wb') if args.output is not None else None
+
+    buffer = bytearray(MAX_DATAGRAM_SIZE)
+    view = memoryview(buffer)
+    started = time.monotonic()
+    reported = started
+
+    def report(now):
+        # Write the interval report and add its counts to the totals
+        line = counter.report(now - reported)
+        for name in total.counts:
+            total.counts[name] += counter.counts[name]
+        total.intervals.extend(counter.intervals)
+        stdout.write((json.dumps(line) if args.json > 0 else report_text(line)) + '\n')
+        stdout.flush()
+        counter.reset()
+
+    try:
+        while args.frames == 0 or counter.closed < args.frames:
+            try:
+                size = udpserver.recv_into(buffer)
+                idle = False
+            except socket.timeout:
+                size = 0
+                idle = True
+
+            now = time.monotonic()
+
+            if size >= 10 and buffer[:8] == ARTNET_DESCRIPTOR_HEADER:
+                opcode = unpack_from('<H', buffer, 8)[0]
+                counter.counts['packets'] += 1
+                counter.counts['bytes'] += size
+
+                if opcode == ARTNET_OPCODE_ARTDMX and size >= ARTDMX_HEADER_SIZE:
+                    universe = unpack_from('<H', buffer, 14)[0] & 0x7fff
+                    length = unpack_from('>H', buffer, 16)[0]
+                    counter.dmx(buffer[ARTDMX_SEQUENCE_OFFSET], universe, view[ARTDMX_HEADER_SIZE: min(size, ARTDMX_HEADER_SIZE + length)], now)
+                elif opcode == ARTNET_OPCODE_ARTSYNC:
+                    counter.sync()
+                else:
+                    counter.counts['ignored'] += 1
+            elif size > 0:
+                counter.counts['ignored'] += 1
+
+            # Nothing received for an interval: the current frame is over,
+            # even without a next frame or an ArtSync to end it (eg. the
+            # last frame of a sender without --sync)
+            if idle and counter.start is not None:
+                counter.close()
+
+            # Rebuilt frames
+            if counter.frames:
+                if output is not None:
+                    output.write(b''.join(counter.frames))
+                counter.frames.clear()
+
+            if now - reported >= args.interval:
+                report(now)
+                reported = now
+
+    except KeyboardInterrupt:
+        pass
+
+    # Last frame (unless the frames count was reached) and summary
+    if args.frames == 0 or counter.closed < args.frames:
+        counter.close()
+    if output is not None:
+        output.write(b''.join(counter.frames))
+        output.close()
+    now = time.monotonic()
+    report(now)
+
+    total.universes = counter.universes
+    stderr.write('\n* Total: ' + (json.dumps(total.report(now - started)) if args.json > 0 else report_text(total.report(now - started))) + '\n')
+
+if __name__ == '__main__':
+    main()